@@ -94,6 +94,9 @@ help_str = "simple debugger interface for armsim. commands are\n"\
 +"  <enter>      execute previous command\n"\
 +"  h            help\n"\
 +"  q            quit\n"
+
+# numbers in commands (stk, b, rb)
+number_pattern = re.compile('[0-9]+')
 '''
 procedure to print a list of separated registers on a single line,
 followed by a newline after the last one. Used to print used registers
@@ -113,36 +116,50 @@ def main(file_name=None, init=None):
     file_name = sys.argv[1] if file_name is None else file_name
     with open(file_name,'r') as f:
         armsim.parse(f.readlines())
+    debug(init)
+
+
+'''
+Runs the debugger on the program that is currently loaded in armsim.
+This lets a caller parse a program once and debug it several times,
+calling armsim.restart() in between runs. init is called after the
+static checks and before the first instruction, so it can be used to
+set up memory or registers
+'''
+
+
+def debug(init=None):
     armsim.check_static_rules()
 
     if init is not None:
         init()
     
     #Aliases for armsim fields (reduce using armsim. everywhere)
-    reg = armsim.reg
     asm = armsim.asm
     mem = armsim.mem
-    lab = armsim.label_regex
-    rg = armsim.register_regex
-    var = armsim.var_regex
+    # precompiled patterns, so that the c command does not look up
+    # a pattern for every instruction it executes
+    label_line = armsim.label_line_pattern
+    rg = armsim.register_pattern
+    var = re.compile(armsim.var_regex)
     cmd = ''
     prevcmd = ' '
     breakpoints = set()
     #flag to use so that program can continue from a breakpoint
     came_from_bp = False
     monitors = set()
-    used_regs = list(set(chain(*[re.findall(rg,instr) for instr in asm])))
+    used_regs = list(set(chain(*[rg.findall(instr) for instr in asm])))
     #sorting isn't perfect, since x10 will come after x1, but it's better
     #than having a random order
     used_regs.sort()
     
-    labels = [l for l in asm if(re.match('{}:'.format(lab),l))]
-    armsim.label_hit_counts = dict(zip(labels, [0]*len(labels)))
+    labels = [l for l in asm if(label_line.match(l))]
+    armsim.label_hit_counts = dict.fromkeys(labels, 0)
     
     line = asm[armsim.pc]
     #print first line
     #if a label in encountered, inc armsim.pc and skip
-    if(re.match(lab+':',line)):
+    if(label_line.match(line)):
         print("<label {}>".format(line));armsim.pc+=1
         armsim.label_hit_counts[line] += 1
     else:
@@ -151,7 +168,7 @@ def main(file_name=None, init=None):
     while(True):
         if(armsim.pc >= len(asm)): print('reached end of program. exiting...');break  
         #if a label in encountered, inc armsim.pc and skip
-        if(re.match(lab+':',line)):
+        if(label_line.match(line)):
             armsim.pc+=1;line = asm[armsim.pc];continue 
         cmd = input('(armdb) ').lower().strip()
         if(not cmd and prevcmd):
@@ -170,33 +187,33 @@ def main(file_name=None, init=None):
         elif (cmd == 'pmem'):
             print(len(armsim.mem))
         elif(cmd.startswith('stk')):
-            numList = re.findall('[0-9]+',cmd)
-            print("SP: {}".format(hex((reg['sp']))))
+            numList = number_pattern.findall(cmd)
+            sp = armsim.reg_vals[armsim.REG_SP]
+            print("SP: {}".format(hex(sp)))
             #print provided number of items
             if(numList):
                 #should only be 1 element in numList
                 num = int(numList[0])
-                #stack elements are stored as a list of bytes
+                #stack elements are stored as bytes
                 for i in range(0, num*8,8):
                     #remember stack goes down, so move up
-                    addr = reg['sp']+i
+                    addr = sp+i
                     #convert list of 8 bytes to value
-                    value = int.from_bytes(bytes(mem[addr:addr+8]),'little')
+                    value = int.from_bytes(mem[addr:addr+8],'little')
                     print("<sp+{}>  {}".format(i,hex(value)))
             #print top 10
             else:
                 for i in range(0,80,8):
-                    addr = reg['sp']+i
-                    value = int.from_bytes(bytes(mem[addr:addr+8]),'little')
+                    addr = sp+i
+                    value = int.from_bytes(mem[addr:addr+8],'little')
                     print("<sp+{}>  {}".format(i,hex(value)))
         elif(cmd == 'heap'):
-            offset = armsim.brk
-            for addr in range(armsim.data_pointer,armsim.brk,8):
-                value = int.from_bytes(bytes(mem[addr:addr+8]),'little')
-                print("<brk-{}>  {}".format(offset,hex(value)))
-                offset -= 8
+            #the heap starts at the original break, right after static data
+            for addr in range(armsim.original_break,armsim.brk,8):
+                value = int.from_bytes(mem[addr:addr+8],'little')
+                print("<brk-{}>  {}".format(armsim.brk-addr,hex(value)))
         elif(cmd.startswith('d ')):
-            variables = set(re.findall(var,cmd.replace('d ', '')))
+            variables = set(var.findall(cmd.replace('d ', '')))
             if(variables):
                 for v in variables:
                     print(str(armsim.getdata(v)).replace('[','').replace(']',''))
@@ -205,7 +222,7 @@ def main(file_name=None, init=None):
         elif(cmd == 'n'):
             armsim.execute(line)
             armsim.pc+=1
-            reg['xzr'] = 0
+            armsim.reg_vals[armsim.REG_XZR] = 0
             #if program has ended we can print monitors and msg
             if(armsim.pc >= len(asm)):
                 print_regs(monitors)
@@ -215,28 +232,28 @@ def main(file_name=None, init=None):
             print("\t"+line)
             print_regs(monitors)
         elif(cmd.startswith('mr')):
-            registers = set(re.findall(rg,cmd))
+            registers = set(rg.findall(cmd))
             if(not registers):print("no registers listed")
             monitors = monitors.union(registers)
         elif(cmd.startswith('cmr')):
-            registers = set(re.findall(rg,cmd))
+            registers = set(rg.findall(cmd))
             if(registers):
                 monitors = monitors.difference()
             else:
                 monitors.clear
         elif(cmd.startswith('b ')):
-            bps = set(re.findall('[0-9]+',cmd))
+            bps = set(number_pattern.findall(cmd))
             for bp in bps: 
                 if(int(bp) not in range(0,len(asm))):
                     print("breakpoint {} out of range".format(bp))
-                elif(re.match(lab+':',asm[int(bp)])):
+                elif(label_line.match(asm[int(bp)])):
                         print("cannot use label as breakpoint")    
                 else:
                     breakpoints.add(int(bp))
             if(not bps):print("no breakpoints listed")
 
         elif(cmd.startswith('rb')):
-            bps = set(re.findall('[0-9]+',cmd))
+            bps = set(number_pattern.findall(cmd))
             for bp in bps: 
                 if(int(bp) not in breakpoints):
                     print("breakpoint {} does not exist".format(bp))
@@ -249,7 +266,7 @@ def main(file_name=None, init=None):
                 while(armsim.pc < len(asm)):
                     #if a label in encountered, inc armsim.pc and skip
                     line = asm[armsim.pc]
-                    if(re.match(lab+':',line)):
+                    if(label_line.match(line)):
                         armsim.label_hit_counts[line] += 1
                         armsim.pc+=1;continue
                     #without the came_from_bp flag, the c command will
@@ -262,7 +279,7 @@ def main(file_name=None, init=None):
                     armsim.execute(line)
                     armsim.pc+=1
                     came_from_bp = False
-                    reg['xzr'] = 0
+                    armsim.reg_vals[armsim.REG_XZR] = 0
                 #if program has ended we can print monitors and msg
                 if(armsim.pc >= len(asm)):
                     print_regs(monitors) 
@@ -1,41 +1,66 @@
+from argparse import ArgumentParser
+from concurrent.futures import ThreadPoolExecutor
 import armdb
 import armsim
-import sys
+import struct
 from simple_cnn import simple_cnn
 
+# The conv max pool output is a contiguous (k, j, i) array of little-endian
+# signed 4 byte ints, so all of it is decoded with this precompiled format
+OUTPUT_STRUCT = struct.Struct(
+    f'<{simple_cnn.TOTAL_KERNELS * simple_cnn.MAX_POOL_OUTPUT_SIZE * simple_cnn.MAX_POOL_OUTPUT_SIZE}i')
 
-def init():
+
+def init(pixels):
     # Load the image into the memory of the assembly program
-    image_matrix = simple_cnn.load_image(sys.argv[1])
+    # Each pixel is a single unsigned byte, so the image is stored row-major
+    # and can be copied into memory with one slice assignment
     image_address = armsim.sym_table['image']
-    for y in range(simple_cnn.INPUT_IMAGE_SIZE):
-        pixel_address = image_address + y * simple_cnn.INPUT_IMAGE_SIZE
-        for x in range(simple_cnn.INPUT_IMAGE_SIZE):
-            pixel_address += x
-            pixel = image_matrix[(y, x)]
-            armsim.mem[pixel_address:pixel_address + 1] = pixel.to_bytes(1, byteorder='little', signed=False)
-
+    armsim.mem[image_address:image_address + len(pixels)] = pixels
 
 
-def main():
-    if not sys.argv[1:]:
-        print("Usage: python3 armdb_simple_cnn.py <image_file_path>")
-        return
 
-    armdb.main('simple_cnn/simple_cnn.s', init)
+def run_image(pixels):
+    # The program is only parsed once, so just put the simulator back to
+    # its state right after parsing before debugging the next image
+    armsim.restart()
+    armdb.debug(lambda: init(pixels))
 
     # Print out the output of conv_max_pool
     print("Conv Max Pool Output:")
+    output_size = simple_cnn.MAX_POOL_OUTPUT_SIZE
+    kernel_size = output_size * output_size
     output_address = armsim.sym_table['conv_max_pool_output']
-    for k in range(simple_cnn.TOTAL_KERNELS):
-        for j in range(simple_cnn.MAX_POOL_OUTPUT_SIZE):
-            for i in range(simple_cnn.MAX_POOL_OUTPUT_SIZE):
-                address = output_address
-                address += ((k * simple_cnn.MAX_POOL_OUTPUT_SIZE + j) * simple_cnn.MAX_POOL_OUTPUT_SIZE + i) * 4
-                value = int.from_bytes(bytes(armsim.mem[address:address + 4]), 'little', signed=True)
-                print(value, end=" ")
-            print()
-        print()
+    output = OUTPUT_STRUCT.unpack_from(armsim.mem, output_address)
+    # The output is kernel-major, so each kernel is one contiguous slab of
+    # the decoded values. Build its rows into one string so that there is a
+    # single print per kernel instead of one per value
+    for kernel_start in range(0, len(output), kernel_size):
+        kernel = output[kernel_start:kernel_start + kernel_size]
+        rows = [" ".join(map(str, kernel[row_start:row_start + output_size])) + " \n"
+                for row_start in range(0, kernel_size, output_size)]
+        print("".join(rows))
+
+
+def main():
+    parser = ArgumentParser(description="Debug the simple_cnn assembly program on the given image(s).")
+    parser.add_argument('image_file_paths', type=str, nargs='+')
+    args = parser.parse_args()
+
+    with open('simple_cnn/simple_cnn.s', 'r') as f:
+        armsim.parse(f.readlines())
+    # Images are decoded on a background thread, so the next image is
+    # already loaded by the time the current one has been debugged. The
+    # init callback then only has to copy the pixels into memory. Only
+    # one image is decoded ahead, so the others are not held in memory
+    paths = args.image_file_paths
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        next_image = executor.submit(simple_cnn.load_image_bytes, paths[0])
+        for i in range(len(paths)):
+            pixels = next_image.result()
+            if i + 1 < len(paths):
+                next_image = executor.submit(simple_cnn.load_image_bytes, paths[i + 1])
+            run_image(pixels)
 
 
 
@@ -1,6 +1,10 @@
 import re
 import sys
 import os
+import struct
+import inspect
+import ast
+from collections.abc import MutableMapping
 
 '''
 *******************
@@ -12,11 +16,12 @@ with the format of gnu assembler files and supports a subset
 of the instructions and directives. The basic operation of
 the simulator is that it first reads in a .s file line by 
 line and separates the input into code and symbol declarations. 
-The data in static memory is simulated with a python list, where
-each element represents one byte as an int. It attempts to execute 
-each line of code by matching against regular expressions that encode 
-the instruction format, and updating global variables appropriately 
-based on that execution. All text is converted to lower case, 
+The data in static memory is simulated with a bytearray, where
+each element is one byte. Loads and stores read and write it in place
+as little-endian values through precompiled struct formats (see mem).
+It attempts to execute each line of code by matching against regular
+expressions that encode the instruction format, and updating global
+variables appropriately based on that execution. All text is converted to lower case, 
 meaning that identifiers are not case sensitive 
 (so variable = VARIABLE).
 Currently supported:
@@ -128,11 +133,50 @@ HEAP_SIZE = 0x4000
 original_break = 0
 # points to current break
 brk = 0
-# dict of register names to values. Will always be numeric values
-reg = {'x0': 0, 'x1': 0, 'x2': 0, 'x3': 0, 'x4': 0, 'x5': 0, 'x6': 0, 'x7': 0, 'x8': 0, 'x9': 0, 'x10': 0,
-       'x11': 0, 'x12': 0, 'x13': 0, 'x14': 0, 'x15': 0, 'x16': 0, 'x17': 0, 'x18': 0, 'x19': 0, 'x20': 0,
-       'x21': 0, 'x22': 0, 'x23': 0, 'x24': 0, 'x25': 0, 'x26': 0, 'x27': 0, 'x28': 0, 'fp': 0, 'lr': 0, 'sp': 0,
-       'xzr': 0}
+'''
+Register values are stored in the reg_vals list, indexed by register
+number (x0-x28 are 0-28, then fp, lr, sp, and xzr). Instructions are
+decoded with register numbers, so executing them only needs list
+indexing. reg is a dict-like view of reg_vals keyed by register name
+(e.g. reg['x0']) for code that inspects or sets registers by name.
+Will always be numeric values
+'''
+REG_NAMES = ['x{}'.format(i) for i in range(29)] + ['fp', 'lr', 'sp', 'xzr']
+REG_IDX = {name: i for i, name in enumerate(REG_NAMES)}
+# register_regex also accepts x29, which is the frame pointer
+REG_IDX['x29'] = REG_IDX['fp']
+REG_LR = REG_IDX['lr']
+REG_SP = REG_IDX['sp']
+REG_XZR = REG_IDX['xzr']
+reg_vals = [0] * len(REG_NAMES)
+
+
+class RegisterFile(MutableMapping):
+    '''
+    Maps register names to the values in reg_vals. There is always an
+    entry for every register, so registers can't be added or removed
+    '''
+
+    def __getitem__(self, name):
+        return reg_vals[REG_IDX[name]]
+
+    def __setitem__(self, name, value):
+        reg_vals[REG_IDX[name]] = value
+
+    def __delitem__(self, name):
+        raise TypeError("registers can't be removed")
+
+    def __iter__(self):
+        return iter(REG_NAMES)
+
+    def __len__(self):
+        return len(REG_NAMES)
+
+    def __repr__(self):
+        return repr(dict(self))
+
+
+reg = RegisterFile()
 # program counter
 pc = 0
 # Note: Python doesn't really have overflow and it would
@@ -148,9 +192,22 @@ dict to hold how often a label has been seen. Intialized in the
 run() procedure, then updated in the main loop every time a label is
 hit. Since the BL instruction does not cause the pc to actually
 land on the label, label_hit_counts must also be updated in execute()
-when a BL instruction is matched (colon must be included)
+when a BL instruction is matched (colon must be included).
+If count_label_hits is False, run() leaves it empty and labels are
+not counted, which saves a dict update every time a loop goes around
 '''
 label_hit_counts = {}
+count_label_hits = True
+
+'''
+dict from each label (including colon) to its index in asm, so
+branches don't have to search asm for their target every time they
+are taken. Built by index_labels() at the end of parse(), and again by
+check_static_rules() if asm has been edited since then (indexed_asm is
+the asm it was built from)
+'''
+label_pcs = {}
+indexed_asm = []
 
 '''
 dict to hold "external" labels that can be targets for BL.
@@ -176,7 +233,7 @@ register_regex:
         negative lookbehind is so that we don't match hex numbers like 0x40
         as registers or labels that happen to have register names
     x[1-2]\d
-        matches registers x10 - x29 (fp is used instead of x29, should fix this)
+        matches registers x10 - x29 (x29 is accepted as an alias of fp)
     (?!\w)
         negative lookahead to ensure that cases like x222 aren't matched
     (?<!0)x\d(?!\w)
@@ -196,6 +253,54 @@ label_regex
         followed by one or more alpanumeric symbols or underscore
 '''
 
+'''
+The regexes above are compiled once into the patterns below, so that
+parsing and decoding don't have to format and look up a pattern for
+every line. The operand patterns are matched against the operands of
+an instruction, i.e. the line without its mnemonic, and capture each
+operand in a group so that the operands can be read straight from the
+match instead of scanning the line again
+'''
+register_pattern = re.compile(register_regex)
+# a line that declares a label
+label_line_pattern = re.compile(label_regex + ':')
+# the last operand of an instruction that takes a register or an
+# immediate: group 1 is set for a register, group 2 for an immediate.
+# Registers and numbers never match the same text, so one match
+# tells the two forms apart
+reg_or_num_regex = '(?:({})|({}))'.format(register_regex, num_regex)
+# rt, [rn] | rt, [rn, imm] | rt, [rn, rm]
+# dollar sign so they don't match pre/post index
+mem_pattern = re.compile('({}),\[({})(?:,{})?\]$'.format(register_regex, register_regex, reg_or_num_regex))
+# rt, =<var>
+mem_var_pattern = re.compile('({}),=({})$'.format(register_regex, var_regex))
+# rd, imm | rd, rn
+reg_operand_pattern = re.compile('({}),{}$'.format(register_regex, reg_or_num_regex))
+# rd, rn, imm | rd, rn, rm
+alu_pattern = re.compile('({}),({}),{}$'.format(register_regex, register_regex, reg_or_num_regex))
+# rn, <label> | <label>
+reg_label_pattern = re.compile('({}),({})$'.format(register_regex, label_regex))
+branch_label_pattern = re.compile('({})$'.format(label_regex))
+# static checks: labels anywhere in a line, branches other than bl,
+# and b <label>. Branches are the lines that start with b or cb (cbz,
+# cbnz, b, b.cond, bl, br), which is checked with startswith first
+label_pattern = re.compile(label_regex)
+loop_branch_pattern = re.compile('c?b(?!l )')
+b_line_pattern = re.compile('b ' + label_regex)
+# the mnemonic of each line (of the lines joined with newlines) that has operands
+mnemonic_pattern = re.compile('^([^ \\n]*) ', re.M)
+# whitespace cleanup
+whitespace_pattern = re.compile('[ \t]+')
+comma_pattern = re.compile('[ ]*,[ ]*')
+colon_pattern = re.compile('[ ]*:')
+period_pattern = re.compile('[ ]*\.')
+dash_pattern = re.compile('[ ]*-[ ]*')
+equals_pattern = re.compile('[ ]*=[ ]*')
+# data directives: <var>:.<directive><operands>
+directive_pattern = re.compile('(.*?):\.(asciz|dword|word|hword|byte|space)(.*)')
+length_pattern = re.compile('(.)+=.-(.)+')
+constant_pattern = re.compile('(.)+=[a-z0-9]+')
+
 '''
 A map of string to int, where int will either be
 an index into the mem array or a size in bytes.
@@ -216,10 +321,13 @@ Types are stored primarily for the get_data procedure
 sym_table = {}
 
 '''
-Data is stored as a list. Each element is an int that represents a byte. 
-String data gets "converted" by doing list(bytes(str,'ascii')) and numbers 
-get converted into a list from their byte representation using list(int.tobytes()).
-It is accessed with an index and a size using the format [addr:addr+size].
+Data is stored as a bytearray, so each element is a byte. String data gets
+"converted" by doing bytes(str,'ascii') and numbers get packed into
+their byte representation with struct.pack().
+Loads and stores read and write it in place with the precompiled structs
+below (byte stores just assign the byte), and everything else accesses
+it with an index and a size using the format [addr:addr+size]. A bytearray takes a single byte per element
+instead of a python int per element.
 The stack pointer also points to the end of this list and grows down.
 It's first filled with the stack, then static data, then the heap. This
 ensures that increasing the heap does not shift the stack or static data.
@@ -231,7 +339,23 @@ Thus, we get the following diagram
         ^        ^     
     <--sp        hp -->
 '''
-mem = []
+mem = bytearray()
+
+# little endian formats used by the loads and stores to access mem in place
+unpack_dword = struct.Struct('<Q').unpack_from
+unpack_sword = struct.Struct('<i').unpack_from
+unpack_hword = struct.Struct('<H').unpack_from
+unpack_shword = struct.Struct('<h').unpack_from
+unpack_byte = struct.Struct('<B').unpack_from
+unpack_sbyte = struct.Struct('<b').unpack_from
+pack_dword = struct.Struct('<Q').pack_into
+pack_word = struct.Struct('<I').pack_into
+pack_hword = struct.Struct('<H').pack_into
+
+# copies of mem and reg taken at the end of parse(). Used by restart()
+# to run the same program again without parsing it again
+parsed_mem = bytearray()
+parsed_reg = []
 
 '''
 Static Rule Variables:
@@ -255,6 +379,8 @@ check_dead_code = False
 # set to add labels that should be recursively called
 # (do not include colon)
 recursive_labels = set()
+# labels that were called recursively during the last run (see _bl())
+recursed_labels = set()
 
 # Performance Flags
 cycle_count = 0
@@ -263,6 +389,106 @@ ld_cycle, ld_dst = -1, -1
 flag_cycle = -1
 last_dst = -1
 
+'''
+Handlers for the data directives. Each one takes the name of the
+variable, the text after the directive, and the index in mem where
+the data starts. The data is appended to mem, the variable is added
+to sym_table, and the size of the data in bytes is returned
+'''
+
+'''
+When encountering something like s: .asciz "a"
+we want to make s a new key in the sym_table dict and 
+set its value equal to the text after the directive.
+Additionally we save the length of the string in a "shadow entry"
+in sym_table in case someone wants to find the length
+using the -. idiom. The string gets converted to bytes
+before it is written to mem
+'''
+
+
+def _parse_asciz(name, text, index):
+    # remove quote characters and the space after the directive
+    text = text.replace('"', '')
+    if (text.startswith(' ')):
+        text = text[1:]
+    # escape characters get mangled to \\<char>, convert to \<char>
+    # for now just tab, carriage return, and newline
+    text = text.replace('\\n', '\n')
+    text = text.replace('\\t', '\t')
+    text = text.replace('\\r', '\r')
+    sym_table[name] = index
+    sym_table[name + "_SIZE_"] = len(text)
+    sym_table[name + "_TYPE_"] = 0
+    mem.extend(bytes(text, 'ascii'))
+    return len(text)
+
+
+'''
+A similar procedure is done the .space directive is used
+We first check if a previously declared variable is being
+used to determine the size. If so we fetch it and use that,
+otherwise we just use the number provided. We append
+n zero bytes to mem where n is the size we found
+Additionally, the size is stored in a shadow entry
+'''
+
+
+def _parse_space(name, text, index):
+    text = text.lower().strip()
+    size = sym_table[text] if text in sym_table else int(text)
+    mem.extend(bytes(size))
+    sym_table[name] = index
+    sym_table[name + "_TYPE_"] = 2
+    sym_table[name + "_SIZE_"] = size
+    return size
+
+
+'''
+The .dword, .word, .hword, and .byte directives are followed by a
+comma separated list of numbers. Each number will be an 8, 4, 2, or 1
+byte entry in mem. Additionally, the _SIZE_ shadow entry will be created
+'''
+
+
+# struct format characters for each width, signed then unsigned
+NUMBER_FORMATS = {8: 'qQ', 4: 'iI', 2: 'hH', 1: 'bB'}
+
+
+def _parse_numbers(name, text, index, width, directive_type):
+    numbers = list(map(int, text.split(',')))
+    size = len(numbers) * width
+    # pack the whole list at once, signed if any number is negative
+    formats = NUMBER_FORMATS[width]
+    fmt = formats[0] if min(numbers) < 0 else formats[1]
+    try:
+        data = struct.pack('<{}{}'.format(len(numbers), fmt), *numbers)
+    except struct.error:
+        # numbers that fit in width bytes unsigned are stored unsigned,
+        # anything else (negative numbers) is stored signed. This handles
+        # lists that mix both, and raises if a number does not fit at all
+        limit = 1 << (8 * width)
+        data = b''.join(int.to_bytes(n, width, 'little', signed=not (0 <= n < limit))
+                        for n in numbers)
+    mem.extend(data)
+
+    sym_table[name] = index
+    sym_table[name + "_SIZE_"] = size
+    sym_table[name + "_TYPE_"] = directive_type
+    return size
+
+
+# directive -> handler
+DIRECTIVES = {
+    'asciz': _parse_asciz,
+    'space': _parse_space,
+    'dword': lambda name, text, index: _parse_numbers(name, text, index, 8, 1),
+    'word': lambda name, text, index: _parse_numbers(name, text, index, 4, 3),
+    'hword': lambda name, text, index: _parse_numbers(name, text, index, 2, 4),
+    'byte': lambda name, text, index: _parse_numbers(name, text, index, 1, 5),
+}
+
+
 '''
 This procedure reads the lines of a program (which can be a .s file
 or just a list of assembly instructions) and populates the
@@ -276,6 +502,7 @@ and buffers and main: or _start: for code.
 
 def parse(lines) -> None:
     global STACK_SIZE, HEAP_SIZE, heap_pointer, original_break, brk
+    global parsed_mem, parsed_reg
     # booleans for parsing .s file
     comment = False
     code = False
@@ -283,8 +510,8 @@ def parse(lines) -> None:
     bss = False
 
     # allocate the stack and set the stack pointer
-    mem.extend(list([0] * STACK_SIZE))
-    reg['sp'] = len(mem) - 1
+    mem.extend(bytes(STACK_SIZE))
+    reg_vals[REG_SP] = len(mem) - 1
     '''
     This is a counter that is used to assign an "address" in mem
     to a symbol. Basically the value in sym_table when a key is one of 
@@ -296,160 +523,40 @@ def parse(lines) -> None:
     for line in lines:
         line = line.strip()
         # convert multiple spaces into one space
-        line = re.sub('[ \t]+', ' ', line)
+        line = whitespace_pattern.sub(' ', line)
         if ('/*' in line and '*/' in line): continue
         if ('//' in line): continue
         if ("/*" in line): comment = True;continue
         if ("*/" in line): comment = False;continue
-        if (".data" in line): data = True;code = False;bss = False;continue
-        if (".bss" in line): data = False;code = False;bss = True;continue
-        if ("main:" in line or "_start:" in line): code = True;data = False;bss = False;continue
-        if (code and not comment and len(line) > 0): line = line.lower();asm.append(line)
+        # section keywords start the line, so only the prefix is compared.
+        # Comments are searched for anywhere since they can follow code
+        if (line.startswith(('.data', '.section .data'))): data = True;code = False;bss = False;continue
+        if (line.startswith(('.bss', '.section .bss'))): data = False;code = False;bss = True;continue
+        if (line.startswith(('main:', '_start:'))): code = True;data = False;bss = False;continue
+        # interned so that repeated lines share one string, and the label and
+        # decode cache lookups on them compare by identity
+        if (code and not comment and len(line) > 0): line = sys.intern(line.lower());asm.append(line)
         if ((data or bss) and not comment):
             # remove quotes and whitespace surrouding punctuation
             # spaces following colons and periods are not touched so
             # that string literals are not altered
-            line = re.sub('[ ]*:', ':', line)
-            line = re.sub('[ ]*\.', '.', line)
-            line = re.sub('[ ]*-[ ]*', '-', line)
-            line = re.sub('[ ]*=[ ]*', '=', line)
-            '''
-            When encountering something like s: .asciz "a"
-            we want to make s a new key in the sym_table dict and 
-            set its value equal to the second element after
-            splitting on the string ":.asciz". Additionally
-            we save the length of the string in a "shadow entry"
-            in sym_table in case someone wants to find the length
-            using the -. idiom. The string gets converted to bytes
-            before it is written to mem
-            '''
-            if (re.match('.*:\.asciz.*', line)):
-                # Don't convert string literals to lower case, so split on quote
-                # and everything to the left becomes lower
-                line = line[0:line.find('\"')].lower() + line[line.find('\"'):]
-                # remove quote characters
-                line = re.sub('["]', '', line)
-                # escape characters get mangled to \\<char>, convert to \<char>
-                # for now just tab, carriage return, and newline
-                line = line.replace('\\n', '\n')
-                line = line.replace('\\t', '\t')
-                line = line.replace('\\r', '\r')
-                line = line.split(":.asciz ")
-                sym_table[line[0]] = index
-                sym_table[line[0] + "_SIZE_"] = len(line[1])
-                sym_table[line[0] + "_TYPE_"] = 0
-                mem.extend(list(bytes(line[1], 'ascii')))
-                index += len(list(line[1]))
-                continue
-            '''
-            A similar procedure is done the .space directive is used
-            We first check if a previously declared variable is being
-            used to determine the size. If so we fetch it and use that,
-            otherwise we just use the number provided. We append a list
-            with n zero values to mem where n is the size we found
-            Additionally, the size is stored in a shadow entry
-            '''
-            if (re.match('.*:\.space.*', line)):
-                line = line.lower()
-                line = line.split(":.space ")
-                size = sym_table[line[1]] if line[1] in sym_table else int(line[1])
-                mem.extend(list([0] * size))
-                sym_table[line[0]] = index
-                sym_table[line[0] + "_TYPE_"] = 2
-                sym_table[line[0] + "_SIZE_"] = size
-                index += size
-                continue
-
-            '''
-            The .dword directive is followed by a comma separated list
-            of numbers. Each number will be an 8 byte entry in mem.
-            Additionally, the _SIZE_ shadow entry will be created
-            '''
-            if (re.match('.*:\.dword.*', line)):
-                line = line.lower()
-                line = line.split(":.dword")
-                numbers = list(map(int, line[1].split(',')))
-                # each number is 8 bytes
-                size = len(numbers) * 8
-                for n in numbers:
-                    signed = not (0 <= n <= 255 ** 8)
-                    mem.extend(list(int.to_bytes(n, 8, 'little', signed=signed)))
-
-                sym_table[line[0]] = index
-                sym_table[line[0] + "_SIZE_"] = size
-                sym_table[line[0] + "_TYPE_"] = 1
-                index += size
-                continue
-
-            '''
-            The .word directive is followed by a comma separated list
-            of numbers. Each number will be a 4 byte entry in mem.
-            Additionally, the _SIZE_ shadow entry will be created
-            '''
-            if (re.match('.*:\.word.*', line)):
-                line = line.lower()
-                line = line.split(":.word")
-                numbers = list(map(int, line[1].split(',')))
-                # each number is 4 bytes
-                size = len(numbers) * 4
-                for n in numbers:
-                    signed = not (0 <= n <= 255 ** 4)
-                    mem.extend(list(int.to_bytes(n, 4, 'little', signed=signed)))
-
-                sym_table[line[0]] = index
-                sym_table[line[0] + "_SIZE_"] = size
-                sym_table[line[0] + "_TYPE_"] = 3
-                index += size
-                continue
-
-            '''
-            The .hword directive is followed by a comma separated list
-            of numbers. Each number will be a 2 byte entry in mem.
-            Additionally, the _SIZE_ shadow entry will be created
-            '''
-            if (re.match('.*:\.hword.*', line)):
-                line = line.lower()
-                line = line.split(":.hword")
-                numbers = list(map(int, line[1].split(',')))
-                # each number is 2 bytes
-                size = len(numbers) * 2
-                for n in numbers:
-                    signed = not (0 <= n <= 255 ** 2)
-                    mem.extend(list(int.to_bytes(n, 2, 'little', signed=signed)))
-
-                sym_table[line[0]] = index
-                sym_table[line[0] + "_SIZE_"] = size
-                sym_table[line[0] + "_TYPE_"] = 4
-                index += size
-                continue
-
-            '''
-            The .byte directive is followed by a comma separated list
-            of numbers. Each number will be a 1 byte entry in mem.
-            Additionally, the _SIZE_ shadow entry will be created
-            '''
-            if (re.match('.*:\.byte.*', line)):
-                line = line.lower()
-                line = line.split(":.byte")
-                numbers = list(map(int, line[1].split(',')))
-                # each number is 1 bytes
-                size = len(numbers)
-                for n in numbers:
-                    signed = not (0 <= n <= 255)
-                    mem.extend(list(int.to_bytes(n, 1, 'little', signed=signed)))
-
-                sym_table[line[0]] = index
-                sym_table[line[0] + "_SIZE_"] = size
-                sym_table[line[0] + "_TYPE_"] = 5
-                index += size
-                continue
+            line = colon_pattern.sub(':', line)
+            line = period_pattern.sub('.', line)
+            line = dash_pattern.sub('-', line)
+            line = equals_pattern.sub('=', line)
+            # ':.' is only in lines with a directive, so most lines skip the regex
+            if (':.' in line):
+                m = directive_pattern.match(line)
+                if (m):
+                    index += DIRECTIVES[m.group(2)](m.group(1).lower(), m.group(3), index)
+                    continue
 
             '''
             If using the len=.-str idiom to store str length, we
             lookup the length of str that we stored in sym_table
             dict when handling .asciz in the format str_SIZE_ 
             '''
-            if (re.match('(.)+=.-(.)+', line)):
+            if (length_pattern.match(line)):
                 line = line.lower()
                 line = line.split("=.-")
                 if (line[1] not in sym_table):
@@ -461,7 +568,7 @@ def parse(lines) -> None:
             If assigning an existing value, look it up in the sym_table
             and if it's not there, then assume a number is being assigned. 
             '''
-            if (re.match('(.)+=[a-z0-9]+', line)):
+            if (constant_pattern.match(line)):
                 line = line.lower()
                 line = line.split("=")
                 value = 0
@@ -475,968 +582,1626 @@ def parse(lines) -> None:
     brk = original_break
     assert brk == len(mem), \
         "mem list likely incorrect- brk: {} len(mem):{}".format(brk, len(mem))
+    parsed_mem = bytearray(mem)
+    parsed_reg = list(reg_vals)
+    index_labels()
     # extend mem to make room for the stack, then set the stack pointer
-    # mem.extend(list([0]*HEAP_SIZE))
+    # mem.extend(bytes(HEAP_SIZE))
 
 
 '''
-This procedure dispatches and executes the provided line
-of assembly code. In order to deal with the myriad
-addressing modes, a regex method is used to match
-the line to the appropriate action. Once an instruction is matched,
-the arguments are extracted with regular epressions.The procedure 
-returns after executing the matched instruction. If no match is
-found an exception is thrown. Both hexadecimal
-and decimal immediate values are supported. The register
-naming convention is rd for destination register, rn
-for the first arg register and rm for the second arg regsiter
+************************
+* Decoded Instructions *
+************************
+Matching a line against the regular expressions that encode the
+instruction formats is by far the most expensive part of simulating
+an instruction, and the text of a line never changes while a program
+runs. So each line is only matched once: decode() turns it into an
+Insn, which records an integer opcode (one per instruction and
+addressing mode) along with the operands that were extracted from the
+line. Executing an instruction is then just a lookup of its handler
+in the HANDLERS tuple using the opcode.
+run() decodes the whole program up front with decode_program().
+execute() decodes the line it is given (a cache makes sure each
+distinct line is only decoded once), so the debugger and the repl
+get the same benefit.
+'''
+
+# opcodes
+OP_LABEL = 0
+OP_INVALID = 1
+OP_LDURSW_RN = 2
+OP_LDURSW_IMM = 3
+OP_LDURSW_RM = 4
+OP_LDURH_RN = 5
+OP_LDURH_IMM = 6
+OP_LDURH_RM = 7
+OP_LDURB_RN = 8
+OP_LDURB_IMM = 9
+OP_LDURB_RM = 10
+OP_LDUR_VAR = 11
+OP_LDUR_RN = 12
+OP_LDUR_IMM = 13
+OP_LDUR_RM = 14
+OP_STURW_RN = 15
+OP_STURW_IMM = 16
+OP_STURW_RM = 17
+OP_STURH_RN = 18
+OP_STURH_IMM = 19
+OP_STURH_RM = 20
+OP_STURB_RN = 21
+OP_STURB_IMM = 22
+OP_STURB_RM = 23
+OP_STUR_RN = 24
+OP_STUR_IMM = 25
+OP_STUR_RM = 26
+OP_MOV_IMM = 27
+OP_MOV_RN = 28
+OP_ASR_IMM = 29
+OP_ASR_RM = 30
+OP_LSR_IMM = 31
+OP_LSR_RM = 32
+OP_LSL_IMM = 33
+OP_LSL_RM = 34
+OP_ADD_IMM = 35
+OP_ADD_RM = 36
+OP_SUB_IMM = 37
+OP_SUB_RM = 38
+OP_MUL = 39
+OP_UDIV = 40
+OP_SDIV = 41
+OP_CMP_RM = 42
+OP_CMP_IMM = 43
+OP_AND_IMM = 44
+OP_AND_RM = 45
+OP_ORR_IMM = 46
+OP_ORR_RM = 47
+OP_EOR_IMM = 48
+OP_EOR_RM = 49
+OP_CBNZ = 50
+OP_CBZ = 51
+OP_B = 52
+OP_B_LT = 53
+OP_B_LE = 54
+OP_B_GT = 55
+OP_B_GE = 56
+OP_B_EQ = 57
+OP_B_NE = 58
+OP_B_MI = 59
+OP_B_PL = 60
+OP_BL = 61
+OP_BR_LR = 62
+OP_SVC = 63
+
+
+class Insn:
+    '''
+    A decoded instruction. Registers are stored by their index in
+    reg_vals, imm holds an immediate value, label holds a branch target
+    (without the colon) and target holds the index of that label in asm,
+    signed is used by the loads that can sign extend, and set_flags is
+    True for the {s} variants of instructions. line is the text that the
+    instruction was decoded from, which is used in error messages.
+    If the line could not be decoded, op is OP_INVALID and error holds
+    the exception that will be raised when the instruction is executed.
+    run() does not read the operands from here while the program runs:
+    they are written into the generated code as constants (see
+    compile_insn())
+    '''
+    __slots__ = ('op', 'line', 'rd', 'rn', 'rm', 'imm', 'label', 'target', 'signed', 'set_flags', 'error')
+
+    def __init__(self, op, line, rd=None, rn=None, rm=None, imm=0, label=None, target=None,
+                 signed=False, set_flags=False, error=None):
+        self.op = op
+        self.line = line
+        self.rd = rd
+        self.rn = rn
+        self.rm = rm
+        self.imm = imm
+        self.label = label
+        self.target = target
+        self.signed = signed
+        self.set_flags = set_flags
+        self.error = error
+
+
+# the decoded form of every line in asm, indexed by pc. Filled by decode_program()
+decoded = []
+# cache of decoded lines used by execute(), keyed by the text of the line
+decode_cache = {}
+
+# cycle in which the instruction currently being executed started
+current_cycle = 0
+# a generated function for every line in asm, indexed by pc. Filled by compile_program()
+compiled = []
+# cache of the generated functions, keyed by the text of the line
+compile_cache = {}
+
+'''
+This procedure decodes a single line of assembly code into an Insn.
+The mnemonic (everything before the first space) is looked up in
+DECODERS, and the decoder for that mnemonic matches the operands
+against the few addressing modes that the instruction supports, so
+a line is never tried against the patterns of other instructions.
+Once an addressing mode is matched, the arguments are extracted with
+regular expressions. Both hexadecimal and decimal immediate values are
+supported. The register naming convention is rd for destination
+register, rn for the first arg register and rm for the second arg
+register.
 Notes:
 -int(str,0) means that both numerical strings and hex strings
 will be properly converted
--Error message is very general, so any syntax errors or use 
+-Error message is very general, so any syntax errors or use
 of unsupported instructions will throw the same error.
 -If an illegal register is used, it will trigger a syntax error
 -If a register is used in a branch instr that doesn't take them,
 an error is raised
+-Branches to a label that isn't declared in the program are errors
+(bl is the exception, since it can also call a linked label)
+Errors are not raised here. Instead an OP_INVALID Insn is returned
+so that the error is raised if (and only if) the line is executed
+'''
+
+
+def decode(line: str) -> Insn:
+    try:
+        return _decode(line)
+    except (ValueError, KeyError) as e:
+        return Insn(OP_INVALID, line, error=e)
+
+
+def _decode(line: str) -> Insn:
+    if (label_line_pattern.match(line)):
+        return Insn(OP_LABEL, line)
+
+    # remove spaces around commas
+    line = comma_pattern.sub(',', line)
+    # octothorpe is optional, remove it
+    line = line.replace('#', '')
+
+    mnemonic, _, operands = line.partition(' ')
+    decoder = DECODERS.get(mnemonic)
+    insn = decoder(operands, line) if decoder else None
+    if insn is None:
+        raise ValueError("Unsupported instruction or syntax error: " + line)
+    return insn
+
+
+'''
+Returns the index in asm of a label (including colon). A ValueError
+is raised if the program doesn't declare the label
+'''
+
+
+def label_pc(label: str) -> int:
+    index = label_pcs.get(label)
+    if index is None:
+        raise ValueError("{} is not a label in the program".format(label))
+    return index
+
+
+'''
+Decoders for each group of instructions. Each one takes the operands
+(the line without the mnemonic) and the whole line, and returns None if
+the operands don't match any of the addressing modes of the instruction
+'''
+
+
+# load/store rt, [rn] | [rn, imm] | [rn, rm]
+def _decode_mem(operands, line, op_rn, op_imm, op_rm, signed=False):
+    m = mem_pattern.match(operands)
+    if (not m):
+        return None
+    rt, rn = REG_IDX[m[1]], REG_IDX[m[2]]
+    # rt, [rn, rm]
+    if (m[3]):
+        return Insn(op_rm, line, rd=rt, rn=rn, rm=REG_IDX[m[3]], signed=signed)
+    # rt, [rn, imm]
+    if (m[4]):
+        return Insn(op_imm, line, rd=rt, rn=rn, imm=int(m[4], 0), signed=signed)
+    # rt, [rn]
+    return Insn(op_rn, line, rd=rt, rn=rn, signed=signed)
+
+
+# ldur also has the rt, =<var> form
+def _decode_ldur(operands, line):
+    m = mem_var_pattern.match(operands)
+    if (m):
+        return Insn(OP_LDUR_VAR, line, rd=REG_IDX[m[1]], label=m[2])
+    return _decode_mem(operands, line, OP_LDUR_RN, OP_LDUR_IMM, OP_LDUR_RM)
+
+
+def _decode_mov(operands, line):
+    m = reg_operand_pattern.match(operands)
+    if (not m):
+        return None
+    # mov rd, rn
+    if (m[2]):
+        return Insn(OP_MOV_RN, line, rd=REG_IDX[m[1]], rn=REG_IDX[m[2]])
+    # mov rd, imm
+    return Insn(OP_MOV_IMM, line, rd=REG_IDX[m[1]], imm=int(m[3], 0))
+
+
+# arithmetic/logical rd, rn, imm | rd, rn, rm
+# op_imm is None for instructions that don't have an immediate form
+def _decode_alu(operands, line, op_imm, op_rm, set_flags=False):
+    m = alu_pattern.match(operands)
+    if (not m):
+        return None
+    # rd, rn, rm
+    if (m[3]):
+        return Insn(op_rm, line, rd=REG_IDX[m[1]], rn=REG_IDX[m[2]], rm=REG_IDX[m[3]], set_flags=set_flags)
+    # rd, rn, imm
+    if (op_imm is None):
+        return None
+    return Insn(op_imm, line, rd=REG_IDX[m[1]], rn=REG_IDX[m[2]], imm=int(m[4], 0), set_flags=set_flags)
+
+
+def _decode_cmp(operands, line):
+    m = reg_operand_pattern.match(operands)
+    if (not m):
+        return None
+    # cmp rn, rm
+    if (m[2]):
+        return Insn(OP_CMP_RM, line, rn=REG_IDX[m[1]], rm=REG_IDX[m[2]])
+    # cmp rn, imm
+    return Insn(OP_CMP_IMM, line, rn=REG_IDX[m[1]], imm=int(m[3], 0))
+
+
+'''
+branch instructions
+NB. A value error is raised if a register is included where it shouldn't be
+(this includes labels that contain a register name, like display)
+'''
+
+
+# cbnz/cbz rn, <label>
+def _decode_cb(operands, line, op, name):
+    m = reg_label_pattern.match(operands)
+    if (m):
+        if (len(register_pattern.findall(operands)) != 1):
+            raise ValueError("{} takes one register".format(name))
+        return Insn(op, line, rn=REG_IDX[m[1]], label=m[2], target=label_pc(m[2] + ':'))
+    return None
+
+
+# b{.cond}/bl <label>
+def _decode_branch(operands, line, op, name):
+    m = branch_label_pattern.match(operands)
+    if (m):
+        if (register_pattern.search(operands)):
+            raise ValueError("{} takes no registers".format(name))
+        # bl can also call a python function in linked_labels, so
+        # its target is checked when it is executed
+        if (op == OP_BL):
+            return Insn(op, line, label=m[1], target=label_pcs.get(m[1] + ':'))
+        return Insn(op, line, label=m[1], target=label_pc(m[1] + ':'))
+    return None
+
+
+# decoder for each mnemonic. Conditional branches can be written with
+# or without the dot (b.lt or blt)
+DECODERS = {
+    'ldursw': lambda o, l: _decode_mem(o, l, OP_LDURSW_RN, OP_LDURSW_IMM, OP_LDURSW_RM),
+    'ldurh': lambda o, l: _decode_mem(o, l, OP_LDURH_RN, OP_LDURH_IMM, OP_LDURH_RM),
+    'ldursh': lambda o, l: _decode_mem(o, l, OP_LDURH_RN, OP_LDURH_IMM, OP_LDURH_RM, signed=True),
+    'ldurb': lambda o, l: _decode_mem(o, l, OP_LDURB_RN, OP_LDURB_IMM, OP_LDURB_RM),
+    'ldursb': lambda o, l: _decode_mem(o, l, OP_LDURB_RN, OP_LDURB_IMM, OP_LDURB_RM, signed=True),
+    'ldur': _decode_ldur,
+    'sturw': lambda o, l: _decode_mem(o, l, OP_STURW_RN, OP_STURW_IMM, OP_STURW_RM),
+    'sturh': lambda o, l: _decode_mem(o, l, OP_STURH_RN, OP_STURH_IMM, OP_STURH_RM),
+    'sturb': lambda o, l: _decode_mem(o, l, OP_STURB_RN, OP_STURB_IMM, OP_STURB_RM),
+    'stur': lambda o, l: _decode_mem(o, l, OP_STUR_RN, OP_STUR_IMM, OP_STUR_RM),
+    'mov': _decode_mov,
+    'asr': lambda o, l: _decode_alu(o, l, OP_ASR_IMM, OP_ASR_RM),
+    'lsr': lambda o, l: _decode_alu(o, l, OP_LSR_IMM, OP_LSR_RM),
+    'lsl': lambda o, l: _decode_alu(o, l, OP_LSL_IMM, OP_LSL_RM),
+    'add': lambda o, l: _decode_alu(o, l, OP_ADD_IMM, OP_ADD_RM),
+    'adds': lambda o, l: _decode_alu(o, l, OP_ADD_IMM, OP_ADD_RM, set_flags=True),
+    'sub': lambda o, l: _decode_alu(o, l, OP_SUB_IMM, OP_SUB_RM),
+    'subs': lambda o, l: _decode_alu(o, l, OP_SUB_IMM, OP_SUB_RM, set_flags=True),
+    'mul': lambda o, l: _decode_alu(o, l, None, OP_MUL),
+    'udiv': lambda o, l: _decode_alu(o, l, None, OP_UDIV),
+    'sdiv': lambda o, l: _decode_alu(o, l, None, OP_SDIV),
+    'cmp': _decode_cmp,
+    'and': lambda o, l: _decode_alu(o, l, OP_AND_IMM, OP_AND_RM),
+    'ands': lambda o, l: _decode_alu(o, l, OP_AND_IMM, OP_AND_RM, set_flags=True),
+    'orr': lambda o, l: _decode_alu(o, l, OP_ORR_IMM, OP_ORR_RM),
+    'orrs': lambda o, l: _decode_alu(o, l, OP_ORR_IMM, OP_ORR_RM, set_flags=True),
+    'eor': lambda o, l: _decode_alu(o, l, OP_EOR_IMM, OP_EOR_RM),
+    'eors': lambda o, l: _decode_alu(o, l, OP_EOR_IMM, OP_EOR_RM, set_flags=True),
+    'cbnz': lambda o, l: _decode_cb(o, l, OP_CBNZ, 'cbnz'),
+    'cbz': lambda o, l: _decode_cb(o, l, OP_CBZ, 'cbz'),
+    'b': lambda o, l: _decode_branch(o, l, OP_B, 'b'),
+    'bl': lambda o, l: _decode_branch(o, l, OP_BL, 'bl'),
+    'br': lambda o, l: Insn(OP_BR_LR, l) if o == 'lr' else None,
+    'svc': lambda o, l: Insn(OP_SVC, l) if o == '0' else None,
+}
+for cond, op in (('lt', OP_B_LT), ('le', OP_B_LE), ('gt', OP_B_GT), ('ge', OP_B_GE),
+                 ('eq', OP_B_EQ), ('ne', OP_B_NE), ('mi', OP_B_MI), ('pl', OP_B_PL)):
+    DECODERS['b.' + cond] = DECODERS['b' + cond] = \
+        lambda o, l, op=op, name='b' + cond: _decode_branch(o, l, op, name)
+
+
+'''
+Returns the decoded form of line, decoding it only the first time it
+is seen. The text of a line is cleaned up (spaces around commas and
+octothorpes removed) as part of decoding it, so this is also only done
+once per line. The cache is cleared by parse(), since the branch
+targets depend on the program
+'''
+
+
+def cached_decode(line: str) -> Insn:
+    insn = decode_cache.get(line)
+    if insn is None:
+        insn = decode(line)
+        decode_cache[line] = insn
+    return insn
+
+
+'''
+Decodes every line in asm into the decoded list, so that
+decoded[pc] is the instruction at asm[pc]. Called at the start of run().
+Running the same program again (see restart()) reuses the decoded lines
+'''
+
+
+def decode_program():
+    global decoded
+    decoded = [cached_decode(line) for line in asm]
+
+
+'''
+This procedure executes the provided line of assembly code. The line
+is decoded (see decode()) and the function generated for the decoded
+instruction (see compile_insn()) is called. The functions are cached,
+so a line that is executed many times is only decoded and generated
+once. If the line is not a supported instruction an exception is thrown
 '''
 
 
 def execute(line: str):
-    global pc, n_flag, z_flag, label_hit_counts, mem
-    global original_break, brk, STACK_SIZE, HEAP_SIZE
-    global register_regex, num_regex, var_regex, label_regex
-    global cycle_count, execute_count, ld_cycle, ld_dst
-    global flag_cycle, last_dst
+    code = compile_cache.get(line)
+    if code is None:
+        code = compile_cache[line] = compile_insn(cached_decode(line))
+    code()
+
+
+'''
+Executes a decoded instruction. The cycle counters are updated,
+then the instruction's handler is looked up using its opcode.
+'''
+
+
+def execute_insn(insn: Insn):
+    global cycle_count, execute_count, current_cycle, last_dst
     current_cycle = cycle_count
     cycle_count += 1
     execute_count += 1
     last_dst = None
+    HANDLERS[insn.op](insn)
 
-    # remove spaces around commas
-    line = re.sub('[ ]*,[ ]*', ',', line)
-    # octothorpe is optional, remove it
-    line = re.sub('#', '', line)
-
-    # use abbreviations for the regexes
-    rg = register_regex
-    num = num_regex
-    var = var_regex
-    lab = label_regex
-
-    # all labels in program (better feedback for typos/malformed branches
-    # [:-1] is so that the colon in the label is not included
-    labels = [l[:-1] for l in asm if (re.match('{}:'.format(lab), l))]
-
-    '''ldursw instructions'''
-    # ldursw rt, [rn]
-    # dollar sign so it doesn't match post index
-    if (re.match('ldursw {},\[{}\]$'.format(rg, rg), line)):
-        rt = re.findall(rg, line)[0]
-        rn = re.findall(rg, line)[1]
-        if ld_dst == rn and (current_cycle - ld_cycle) <= 2:
-            cycle_count += 1
-        addr = reg[rn]
-        # check for out of bounds mem access
-        if (addr < reg['sp'] or addr > len(mem) - 4):
-            raise ValueError("out of bounds memory access: {}".format(line))
-        # load 4 bytes starting at addr and convert to int
-        reg[rt] = int.from_bytes(bytes(mem[addr:addr + 4]), 'little', signed=True)
-        ld_cycle = current_cycle
-        ld_dst = rt
-        return
-    # ldursw rt, [rn, imm]
-    # dollar sign so it doesn't match pre index
-    if (re.match('ldursw {},\[{},{}\]$'.format(rg, rg, num), line)):
-        rt = re.findall(rg, line)[0]
-        rn = re.findall(rg, line)[1]
-        if ld_dst == rn and (current_cycle - ld_cycle <= 2):
-            cycle_count += (current_cycle - ld_cycle)
-        imm = int(re.findall(num, line)[-1], 0)
-        addr = reg[rn] + imm
-        # check for out of bounds mem access
-        if (addr < reg['sp'] or addr > len(mem) - 2):
-            raise ValueError("out of bounds memory access: {}".format(line))
-        # load 4 byte starting at addr and convert to int
-        reg[rt] = int.from_bytes(bytes(mem[addr:addr + 4]), 'little', signed=True)
-        ld_cycle = current_cycle
-        ld_dst = rt
-        return
-    # ldursw rt, [rn, rm]
-    # dollar sign so it doesn't match pre index
-    if (re.match('ldursw {},\[{},{}\]$'.format(rg, rg, rg), line)):
-        rt = re.findall(rg, line)[0]
-        rn = re.findall(rg, line)[1]
-        rm = re.findall(rg, line)[2]
-        if (ld_dst == rn or ld_dst == rm) and (current_cycle - ld_cycle) <= 2:
-            cycle_count += (current_cycle - ld_cycle)
-        addr = reg[rn] + reg[rm]
-        # check for out of bounds mem access
-        if (addr < reg['sp'] or addr > len(mem) - 2):
-            raise ValueError("out of bounds memory access: {} at {}".format(line, addr))
-        # load 4 byte starting at addr and convert to int
-        reg[rt] = int.from_bytes(bytes(mem[addr:addr + 4]), 'little', signed=True)
-        ld_cycle = current_cycle
-        ld_dst = rt
-        return
-
-    '''ldurh instructions'''
-    # ldurh rt, [rn]
-    # dollar sign so it doesn't match post index
-    if (re.match('ldurs?h {},\[{}\]$'.format(rg, rg), line)):
-        signed = 'ldursh' in line
-        rt = re.findall(rg, line)[0]
-        rn = re.findall(rg, line)[1]
-        if ld_dst == rn and (current_cycle - ld_cycle) <= 2:
-            cycle_count += 1
-        addr = reg[rn]
-        # check for out of bounds mem access
-        if (addr < reg['sp'] or addr > len(mem) - 2):
-            raise ValueError("out of bounds memory access: {}".format(line))
-        # load 2 bytes starting at addr and convert to int
-        reg[rt] = int.from_bytes(bytes(mem[addr:addr + 2]), 'little', signed=signed)
-        ld_cycle = current_cycle
-        ld_dst = rt
-        return
-    # ldurh rt, [rn, imm]
-    # dollar sign so it doesn't match pre index
-    if (re.match('ldurs?h {},\[{},{}\]$'.format(rg, rg, num), line)):
-        signed = 'ldursh' in line
-        rt = re.findall(rg, line)[0]
-        rn = re.findall(rg, line)[1]
-        if ld_dst == rn and (current_cycle - ld_cycle <= 2):
-            cycle_count += (current_cycle - ld_cycle)
-        imm = int(re.findall(num, line)[-1], 0)
-        addr = reg[rn] + imm
-        # check for out of bounds mem access
-        if (addr < reg['sp'] or addr > len(mem) - 2):
-            raise ValueError("out of bounds memory access: {}".format(line))
-        # load 2 byte starting at addr and convert to int
-        reg[rt] = int.from_bytes(bytes(mem[addr:addr + 2]), 'little', signed=signed)
-        ld_cycle = current_cycle
-        ld_dst = rt
-        return
-    # ldurh rt, [rn, rm]
-    # dollar sign so it doesn't match pre index
-    if (re.match('ldurs?h {},\[{},{}\]$'.format(rg, rg, rg), line)):
-        signed = 'ldursh' in line
-        rt = re.findall(rg, line)[0]
-        rn = re.findall(rg, line)[1]
-        rm = re.findall(rg, line)[2]
-        if (ld_dst == rn or ld_dst == rm) and (current_cycle - ld_cycle) <= 2:
-            cycle_count += (current_cycle - ld_cycle)
-        addr = reg[rn] + reg[rm]
-        # check for out of bounds mem access
-        if (addr < reg['sp'] or addr > len(mem) - 2):
-            raise ValueError("out of bounds memory access: {}".format(line))
-        # load 2 byte starting at addr and convert to int
-        reg[rt] = int.from_bytes(bytes(mem[addr:addr + 2]), 'little', signed=signed)
-        ld_cycle = current_cycle
-        ld_dst = rt
-        return
-
-    '''ldurb instructions'''
-    # ldurb rt, [rn]
-    # dollar sign so it doesn't match post index
-    if (re.match('ldurs?b {},\[{}\]$'.format(rg, rg), line)):
-        signed = 'ldursb' in line
-        rt = re.findall(rg, line)[0]
-        rn = re.findall(rg, line)[1]
-        if ld_dst == rn and (current_cycle - ld_cycle) <= 2:
-            cycle_count += 1
-        addr = reg[rn]
-        # check for out of bounds mem access
-        if (addr < reg['sp'] or addr > len(mem) - 1):
-            raise ValueError("out of bounds memory access: {}".format(line))
-        # load 1 bytes starting at addr and convert to int
-        reg[rt] = int.from_bytes(bytes(mem[addr:addr + 1]), 'little', signed=signed)
-        ld_cycle = current_cycle
-        ld_dst = rt
-        return
-    # ldurb rt, [rn, imm]
-    # dollar sign so it doesn't match pre index
-    if (re.match('ldurs?b {},\[{},{}\]$'.format(rg, rg, num), line)):
-        signed = 'ldursb' in line
-        rt = re.findall(rg, line)[0]
-        rn = re.findall(rg, line)[1]
-        if ld_dst == rn and (current_cycle - ld_cycle) <= 2:
-            cycle_count += 1
-        imm = int(re.findall(num, line)[-1], 0)
-        addr = reg[rn] + imm
-        # check for out of bounds mem access
-        if (addr < reg['sp'] or addr > len(mem) - 1):
-            raise ValueError("out of bounds memory access: {}".format(line))
-        # load 1 byte starting at addr and convert to int
-        reg[rt] = int.from_bytes(bytes(mem[addr:addr + 1]), 'little', signed=signed)
-        ld_cycle = current_cycle
-        ld_dst = rt
-        return
-    # ldurb rt, [rn, rm]
-    # dollar sign so it doesn't match pre index
-    if (re.match('ldurs?b {},\[{},{}\]$'.format(rg, rg, rg), line)):
-        signed = 'ldursb' in line
-        rt = re.findall(rg, line)[0]
-        rn = re.findall(rg, line)[1]
-        rm = re.findall(rg, line)[2]
-        if (ld_dst == rn or ld_dst == rm) and (current_cycle - ld_cycle) <= 2:
-            cycle_count += (current_cycle - ld_cycle)
-        addr = reg[rn] + reg[rm]
-        # check for out of bounds mem access
-        if (addr < reg['sp'] or addr > len(mem) - 1):
-            raise ValueError("out of bounds memory access: {}".format(line))
-        # load 1 byte starting at addr and convert to int
-        reg[rt] = int.from_bytes(bytes(mem[addr:addr + 1]), 'little', signed=signed)
-        ld_cycle = current_cycle
-        ld_dst = rt
-        return
 
-    '''
-    ldur instructions
-    '''
-    # ldur rt, =<var>
-    if (re.match('ldur {},={}$'.format(rg, var), line)):
-        rt = re.findall(rg, line)[0]
-        v = re.findall('=' + var, line)[0][1:]
-        reg[rt] = sym_table[v]
-        ld_cycle = current_cycle
-        ld_dst = rt
-        return
-    # ldur rt, [rn]
-    # dollar sign so it doesn't match post index
-    if (re.match('ldur {},\[{}\]$'.format(rg, rg), line)):
-        rt = re.findall(rg, line)[0]
-        rn = re.findall(rg, line)[1]
-        if ld_dst == rn and (current_cycle - ld_cycle) <= 2:
-            cycle_count += 1
-        addr = reg[rn]
-        # check for out of bounds mem access
-        if (addr < reg['sp'] or addr > len(mem) - 8):
-            raise ValueError("out of bounds memory access: {}".format(line))
-        # load 8 bytes starting at addr and convert to int
-        reg[rt] = int.from_bytes(bytes(mem[addr:addr + 8]), 'little')
-        ld_cycle = current_cycle
-        ld_dst = rt
-        return
-    # ldur rt, [rn, imm]
-    # dollar sign so it doesn't match pre index
-    if (re.match('ldur {},\[{},{}\]$'.format(rg, rg, num), line)):
-        rt = re.findall(rg, line)[0]
-        rn = re.findall(rg, line)[1]
-        if ld_dst == rn and (current_cycle - ld_cycle) <= 2:
-            cycle_count += 1
-        imm = int(re.findall(num, line)[-1], 0)
-        addr = reg[rn] + imm
-        # check for out of bounds mem access
-        if (addr < reg['sp'] or addr > len(mem) - 8):
-            raise ValueError("out of bounds memory access: {}".format(line))
-        # load 8 bytes starting at addr and convert to int
-        reg[rt] = int.from_bytes(bytes(mem[addr:addr + 8]), 'little')
-        ld_cycle = current_cycle
-        ld_dst = rt
-        return
-    # ldur rt, [rn, rm]
-    # dollar sign so it doesn't match pre index
-    if (re.match('ldur {},\[{},{}\]$'.format(rg, rg, rg), line)):
-        rt = re.findall(rg, line)[0]
-        rn = re.findall(rg, line)[1]
-        rm = re.findall(rg, line)[2]
-        if (ld_dst == rn or ld_dst == rm) and (current_cycle - ld_cycle) <= 2:
-            cycle_count += 1
-        addr = reg[rn] + reg[rm]
-        # check for out of bounds mem access
-        if (addr < reg['sp'] or addr > len(mem) - 8):
-            raise ValueError("out of bounds memory access: {}".format(line))
-        # load 8 bytes starting at addr and convert to int
-        reg[rt] = int.from_bytes(bytes(mem[addr:addr + 8]), 'little')
-        ld_cycle = current_cycle
-        ld_dst = rt
-        return
-    '''sturw instruction'''
-    # sturw rt, [rn]
-    # dollar sign so it doesn't match post index
-    if (re.match('sturw {},\[{}\]$'.format(rg, rg), line)):
-        rt = re.findall(rg, line)[0]
-        rn = re.findall(rg, line)[1]
-        if ld_dst == rn and (current_cycle - ld_cycle <= 2):
-            cycle_count += (current_cycle - ld_cycle)
-        addr = reg[rn]
-        # check for out of bounds mem access
-        if (addr < reg['sp'] or addr > len(mem) - 2):
-            raise ValueError("out of bounds memory access: {}".format(line))
-
-        register_bytes = list(int.to_bytes((reg[rt]), 8, 'little', signed=True))
-        mem[addr:addr + 4] = register_bytes[:4]
-        return
-    # sturw rt, [rn, imm]
-    # dollar sign so it doesn't match pre index
-    if (re.match('sturw {},\[{},{}\]$'.format(rg, rg, num), line)):
-        rt = re.findall(rg, line)[0]
-        rn = re.findall(rg, line)[1]
-        if ld_dst == rn and (current_cycle - ld_cycle <= 2):
-            cycle_count += (current_cycle - ld_cycle)
-        imm = int(re.findall(num, line)[-1], 0)
-        addr = reg[rn] + imm
-        # check for out of bounds mem access
-        if (addr < reg['sp'] or addr > len(mem) - 2):
-            raise ValueError("out of bounds memory access: {}".format(line))
-        register_bytes = list(int.to_bytes((reg[rt]), 8, 'little', signed=True))
-        mem[addr:addr + 4] = register_bytes[:4]
-        return
-    # sturw rt, [rn, rm]
-    # dollar sign so it doesn't match pre index
-    if (re.match('sturw {},\[{},{}\]$'.format(rg, rg, rg), line)):
-        rt = re.findall(rg, line)[0]
-        rn = re.findall(rg, line)[1]
-        rm = re.findall(rg, line)[2]
-        if (ld_dst == rn or ld_dst == rm) and (current_cycle - ld_cycle <= 2):
-            cycle_count += 1
-        addr = reg[rn] + reg[rm]
-        # check for out of bounds mem access
-        if (addr < reg['sp'] or addr > len(mem) - 2):
-            raise ValueError("out of bounds memory access: {}".format(line))
-        register_bytes = list(int.to_bytes((reg[rt]), 8, 'little', signed=True))
-        mem[addr:addr + 4] = register_bytes[:4]
-        return
-    '''sturh instruction'''
-    # sturh rt, [rn]
-    # dollar sign so it doesn't match post index
-    if (re.match('sturh {},\[{}\]$'.format(rg, rg), line)):
-        rt = re.findall(rg, line)[0]
-        rn = re.findall(rg, line)[1]
-        if ld_dst == rn and (current_cycle - ld_cycle <= 2):
-            cycle_count += (current_cycle - ld_cycle)
-        addr = reg[rn]
-        # check for out of bounds mem access
-        if (addr < reg['sp'] or addr > len(mem) - 2):
-            raise ValueError("out of bounds memory access: {}".format(line))
-
-        register_bytes = list(int.to_bytes((reg[rt]), 8, 'little', signed=True))
-        mem[addr:addr + 2] = register_bytes[:2]
-        return
-    # sturh rt, [rn, imm]
-    # dollar sign so it doesn't match pre index
-    if (re.match('sturh {},\[{},{}\]$'.format(rg, rg, num), line)):
-        rt = re.findall(rg, line)[0]
-        rn = re.findall(rg, line)[1]
-        if ld_dst == rn and (current_cycle - ld_cycle <= 2):
-            cycle_count += (current_cycle - ld_cycle)
-        imm = int(re.findall(num, line)[-1], 0)
-        addr = reg[rn] + imm
-        # check for out of bounds mem access
-        if (addr < reg['sp'] or addr > len(mem) - 2):
-            raise ValueError("out of bounds memory access: {}".format(line))
-        register_bytes = list(int.to_bytes((reg[rt]), 8, 'little', signed=True))
-        mem[addr:addr + 2] = register_bytes[:2]
-        return
-    # sturh rt, [rn, rm]
-    # dollar sign so it doesn't match pre index
-    if (re.match('sturh {},\[{},{}\]$'.format(rg, rg, rg), line)):
-        rt = re.findall(rg, line)[0]
-        rn = re.findall(rg, line)[1]
-        rm = re.findall(rg, line)[2]
-        if (ld_dst == rn or ld_dst == rm) and (current_cycle - ld_cycle <= 2):
-            cycle_count += 1
-        addr = reg[rn] + reg[rm]
-        # check for out of bounds mem access
-        if (addr < reg['sp'] or addr > len(mem) - 2):
-            raise ValueError("out of bounds memory access: {}".format(line))
-        register_bytes = list(int.to_bytes((reg[rt]), 8, 'little', signed=True))
-        mem[addr:addr + 2] = register_bytes[:2]
-        return
-    '''sturb instruction'''
-    # sturb rt, [rn]
-    # dollar sign so it doesn't match post index
-    if (re.match('sturb {},\[{}\]$'.format(rg, rg), line)):
-        rt = re.findall(rg, line)[0]
-        rn = re.findall(rg, line)[1]
-        if ld_dst == rn and (current_cycle - ld_cycle <= 2):
-            cycle_count += (current_cycle - ld_cycle)
-        addr = reg[rn]
-        # check for out of bounds mem access
-        if (addr < reg['sp'] or addr > len(mem) - 1):
-            raise ValueError("out of bounds memory access: {}".format(line))
-        register_bytes = list(int.to_bytes((reg[rt]), 8, 'little', signed=True))
-        mem[addr:addr + 1] = register_bytes[:1]
-        return
-    # sturb rt, [rn, imm]
-    # dollar sign so it doesn't match pre index
-    if (re.match('sturb {},\[{},{}\]$'.format(rg, rg, num), line)):
-        rt = re.findall(rg, line)[0]
-        rn = re.findall(rg, line)[1]
-        if ld_dst == rn and (current_cycle - ld_cycle <= 2):
-            cycle_count += (current_cycle - ld_cycle)
-        imm = int(re.findall(num, line)[-1], 0)
-        addr = reg[rn] + imm
-        # check for out of bounds mem access
-        if (addr < reg['sp'] or addr > len(mem) - 1):
-            raise ValueError("out of bounds memory access: {}".format(line))
-        register_bytes = list(int.to_bytes((reg[rt]), 8, 'little', signed=True))
-        mem[addr:addr + 1] = register_bytes[:1]
-        return
-    # sturb rt, [rn, rm]
-    # dollar sign so it doesn't match pre index
-    if (re.match('sturb {},\[{},{}\]$'.format(rg, rg, rg), line)):
-        rt = re.findall(rg, line)[0]
-        rn = re.findall(rg, line)[1]
-        rm = re.findall(rg, line)[2]
-        if (ld_dst == rn or ld_dst == rm) and (current_cycle - ld_cycle <= 2):
-            cycle_count += 1
-        addr = reg[rn] + reg[rm]
-        # check for out of bounds mem access
-        if (addr < reg['sp'] or addr > len(mem) - 1):
-            raise ValueError("out of bounds memory access: {}".format(line))
-        register_bytes = list(int.to_bytes((reg[rt]), 8, 'little', signed=True))
-        mem[addr:addr + 1] = register_bytes[:1]
-        return
-    '''
-    stur instructions
-    '''
-    # stur rt, [rn]
-    # dollar sign so it doesn't match post index
-    if (re.match('stur {},\[{}\]$'.format(rg, rg), line)):
-        rt = re.findall(rg, line)[0]
-        rn = re.findall(rg, line)[1]
-        if ld_dst == rn and (current_cycle - ld_cycle <= 2):
-            cycle_count += (current_cycle - ld_cycle)
-        addr = reg[rn]
-        # check for out of bounds mem access
-        if (addr < reg['sp'] or addr > len(mem) - 8):
-            raise ValueError("out of bounds memory access: {}".format(line))
-        mem[addr:addr + 8] = list(int.to_bytes((reg[rt]), 8, 'little'))
-        return
-    # stur rt, [rn, imm]
-    # dollar sign so it doesn't match pre index
-    if (re.match('stur {},\[{},{}\]$'.format(rg, rg, num), line)):
-        rt = re.findall(rg, line)[0]
-        rn = re.findall(rg, line)[1]
-        imm = int(re.findall(num, line)[-1], 0)
-        addr = reg[rn] + imm
-        # check for out of bounds mem access
-        if (addr < reg['sp'] or addr > len(mem) - 8):
-            raise ValueError("out of bounds memory access: {}".format(line))
-        mem[addr:addr + 8] = list(int.to_bytes((reg[rt]), 8, 'little'))
-        return
-    # stur rt, [rn, rm]
-    # dollar sign so it doesn't match pre index
-    if (re.match('stur {},\[{},{}\]$'.format(rg, rg, rg), line)):
-        rt = re.findall(rg, line)[0]
-        rn = re.findall(rg, line)[1]
-        rm = re.findall(rg, line)[2]
-        if (ld_dst == rn or ld_dst == rm) and (current_cycle - ld_cycle <= 2):
-            cycle_count += 1
-        addr = reg[rn] + reg[rm]
-        # check for out of bounds mem access
-        if (addr < reg['sp'] or addr > len(mem) - 8):
-            raise ValueError("out of bounds memory access: {}".format(line))
-        mem[addr:addr + 8] = list(int.to_bytes((reg[rt]), 8, 'little'))
-        return
-    '''
-    mov instructions
-    '''
-    # mov rd, imm
-    if (re.match('mov {},{}$'.format(rg, num), line)):
-        rd = re.findall(rg, line)[0]
-        imm = int(re.findall(num, line)[-1], 0)
-        reg[rd] = imm
-        last_dst = rd
-        return
-    # mov rd, rn
-    if (re.match('mov {},{}$'.format(rg, rg), line)):
-        rd = re.findall(rg, line)[0]
-        rn = re.findall(rg, line)[1]
-        if ld_dst == rn and (current_cycle - ld_cycle) <= 2:
-            cycle_count += 1
-        reg[rd] = reg[rn]
-        last_dst = rd
-        return
-    '''
-    arithmetic instructions
-    '''
-    # asr rd, rn, imm
-    if (re.match('asr {},{},{}$'.format(rg, rg, num), line)):
-        rd = re.findall(rg, line)[0]
-        rn = re.findall(rg, line)[1]
-        if ld_dst == rn and (current_cycle - ld_cycle) <= 2:
-            cycle_count += (current_cycle - ld_cycle)
-        imm = int(re.findall(num, line)[-1], 0)
-        reg[rd] = reg[rn] >> imm
-        last_dst = rd
-        return
-    # asr rd, rn, rm
-    if (re.match('asr {},{},{}$'.format(rg, rg, num), line)):
-        rd = re.findall(rg, line)[0]
-        rn = re.findall(rg, line)[1]
-        rm = re.findall(rg, line)[2]
-        if (ld_dst == rn or ld_dst == rm) and (current_cycle - ld_cycle <= 2):
-            cycle_count += 1
-        reg[rd] = reg[rn] >> reg[rm]
-        last_dst = rd
-        return
-    # lsr rd, rn, imm
-    if (re.match('lsr {},{},{}$'.format(rg, rg, num), line)):
-        rd = re.findall(rg, line)[0]
-        rn = re.findall(rg, line)[1]
-        if ld_dst == rn and (current_cycle - ld_cycle <= 2):
-            cycle_count += (current_cycle - ld_cycle)
-        imm = int(re.findall(num, line)[-1], 0)
-        reg[rd] = (reg[rn] & 0xFFFFFFFFFFFFFFFF) >> imm
-        last_dst = rd
-        return
-    # lsr rd, rn, rm
-    if (re.match('lsr {},{},{}$'.format(rg, rg, rg), line)):
-        rd = re.findall(rg, line)[0]
-        rn = re.findall(rg, line)[1]
-        rm = re.findall(rg, line)[2]
-        if (ld_dst == rn or ld_dst == rm) and (current_cycle - ld_cycle <= 2):
-            cycle_count += 1
-        reg[rd] = (reg[rn] & 0xFFFFFFFFFFFFFFFF) >> reg[rm]
-        last_dst = rd
-        return
-    # lsl rd, rn, imm
-    if (re.match('lsl {},{},{}$'.format(rg, rg, num), line)):
-        rd = re.findall(rg, line)[0]
-        rn = re.findall(rg, line)[1]
-        if ld_dst == rn and (current_cycle - ld_cycle <= 2):
-            cycle_count += (current_cycle - ld_cycle)
-        imm = int(re.findall(num, line)[-1], 0)
-        reg[rd] = (reg[rn] << imm) & 0xFFFFFFFFFFFFFFFF
-        last_dst = rd
-        return
-    # lsl rd, rn, rm
-    if (re.match('lsl {},{},{}$'.format(rg, rg, rg), line)):
-        rd = re.findall(rg, line)[0]
-        rn = re.findall(rg, line)[1]
-        rm = re.findall(rg, line)[2]
-        if (ld_dst == rn or ld_dst == rm) and (current_cycle - ld_cycle <= 2):
-            cycle_count += 1
-        reg[rd] = (reg[rn] << reg[rm]) & 0xFFFFFFFFFFFFFFFF
-        last_dst = rd
-        return
-    # add{s} rd, rn, imm
-    if (re.match('adds? {},{},{}$'.format(rg, rg, num), line)):
-        rd = re.findall(rg, line)[0]
-        rn = re.findall(rg, line)[1]
-        if ld_dst == rn and (current_cycle - ld_cycle <= 1):
-            cycle_count += 1
-        imm = int(re.findall(num, line)[-1], 0)
-        reg[rd] = reg[rn] + imm
-        if ('adds' in line):
-            n_flag = True if (reg[rd] < 0) else False
-            z_flag = True if (reg[rd] == 0) else False
-            flag_cycle = current_cycle
-        last_dst = rd
-        return
-    # add{s} rd, rn, rm
-    if (re.match('adds? {},{},{}$'.format(rg, rg, rg), line)):
-        rd = re.findall(rg, line)[0]
-        rn = re.findall(rg, line)[1]
-        rm = re.findall(rg, line)[2]
-        if (ld_dst == rn or ld_dst == rm) and (current_cycle - ld_cycle <= 2):
-            cycle_count += 1
-        reg[rd] = reg[rn] + reg[rm]
-        if ('adds' in line):
-            n_flag = True if (reg[rd] < 0) else False
-            z_flag = True if (reg[rd] == 0) else False
-            flag_cycle = current_cycle
-        last_dst = rd
-        return
-    # sub{s} rd, rn, imm
-    if (re.match('subs? {},{},{}$'.format(rg, rg, num), line)):
-        rd = re.findall(rg, line)[0]
-        rn = re.findall(rg, line)[1]
-        if ld_dst == rn and (current_cycle - ld_cycle <= 2):
-            cycle_count += (current_cycle - ld_cycle)
-        imm = int(re.findall(num, line)[-1], 0)
-        reg[rd] = reg[rn] - imm
-        if ('subs' in line):
-            n_flag = True if (reg[rd] < 0) else False
-            z_flag = True if (reg[rd] == 0) else False
-            flag_cycle = current_cycle
-        last_dst = rd
-        return
-    # sub{s} rd, rn, rm
-    if (re.match('subs? {},{},{}$'.format(rg, rg, rg), line)):
-        rd = re.findall(rg, line)[0]
-        rn = re.findall(rg, line)[1]
-        rm = re.findall(rg, line)[2]
-        if (ld_dst == rn or ld_dst == rm) and (current_cycle - ld_cycle <= 2):
-            cycle_count += 1
-        reg[rd] = reg[rn] - reg[rm]
-        if ('subs' in line):
-            n_flag = True if (reg[rd] < 0) else False
-            z_flag = True if (reg[rd] == 0) else False
-            flag_cycle = current_cycle
-        last_dst = rd
-        return
-    # mul rd, rn, rm
-    if (re.match('mul {},{},{}$'.format(rg, rg, rg), line)):
-        rd = re.findall(rg, line)[0]
-        rn = re.findall(rg, line)[1]
-        rm = re.findall(rg, line)[2]
-        if (ld_dst == rn or ld_dst == rm) and (current_cycle - ld_cycle <= 2):
-            cycle_count += 1
-        reg[rd] = reg[rn] * reg[rm]
-        last_dst = rd
-        cycle_count += 4
-        return
-    # For now treat un/signed division the same, since everything
-    # is signed in python, but separate in case this changes
-    # udiv rd, rn, rm
-    if (re.match('udiv {},{},{}$'.format(rg, rg, rg), line)):
-        rd = re.findall(rg, line)[0]
-        rn = re.findall(rg, line)[1]
-        rm = re.findall(rg, line)[2]
-        if (ld_dst == rn or ld_dst == rm) and (current_cycle - ld_cycle <= 2):
-            cycle_count += 1
-        # IMPORTANT: use integer division, not floating point
-        reg[rd] = reg[rn] // reg[rm]
-        last_dst = rd
-        return
-    # sdiv rd, rn, rm
-    if (re.match('sdiv {},{},{}$'.format(rg, rg, rg), line)):
-        rd = re.findall(rg, line)[0]
-        rn = re.findall(rg, line)[1]
-        rm = re.findall(rg, line)[2]
-        if (ld_dst == rn or ld_dst == rm) and (current_cycle - ld_cycle <= 2):
-            cycle_count += 1
-        # IMPORTANT: use integer division, not floating point
-        reg[rd] = reg[rn] // reg[rm]
-        last_dst = rd
-        return
-    '''
-    compare instructions
-    '''
-    # cmp rn, rm
-    if (re.match('cmp {},{}$'.format(rg, rg), line)):
-        rn = re.findall(rg, line)[0]
-        rm = re.findall(rg, line)[1]
-        if (ld_dst == rn or ld_dst == rm) and (current_cycle - ld_cycle <= 2):
-            cycle_count += 1
-        assert rm != 'sp', "2nd register in cmp can't be sp"
-        z_flag = True if reg[rn] == reg[rm] else False
-        n_flag = True if reg[rn] < reg[rm] else False
+'''
+Instruction handlers. There is one for each opcode, and each one takes
+the decoded instruction as its only argument. The cycle penalties are
+kept exactly as they were when they were applied in one big if chain
+so that cycle counts do not change
+'''
+
+
+def _invalid(insn):
+    # labels are not instructions, so executing one is an error
+    if insn.error is None:
+        raise ValueError("Unsupported instruction or syntax error: " + insn.line)
+    raise insn.error
+
+
+'''ldursw instructions'''
+
+
+def _ldursw_rn(insn):
+    global cycle_count, ld_cycle, ld_dst
+    rt, rn = insn.rd, insn.rn
+    if ld_dst == rn and (current_cycle - ld_cycle) <= 2:
+        cycle_count += 1
+    addr = reg_vals[rn]
+    # check for out of bounds mem access
+    if not (reg_vals[REG_SP] <= addr <= len(mem) - 4):
+        raise ValueError("out of bounds memory access: {}".format(insn.line))
+    # load 4 bytes starting at addr and convert to int
+    reg_vals[rt] = unpack_sword(mem, addr)[0]
+    ld_cycle = current_cycle
+    ld_dst = rt
+
+
+def _ldursw_imm(insn):
+    global cycle_count, ld_cycle, ld_dst
+    rt, rn = insn.rd, insn.rn
+    if ld_dst == rn:
+        ld_delta = current_cycle - ld_cycle
+        if ld_delta <= 2:
+            cycle_count += ld_delta
+    addr = reg_vals[rn] + insn.imm
+    # check for out of bounds mem access
+    if not (reg_vals[REG_SP] <= addr <= len(mem) - 4):
+        raise ValueError("out of bounds memory access: {}".format(insn.line))
+    # load 4 byte starting at addr and convert to int
+    reg_vals[rt] = unpack_sword(mem, addr)[0]
+    ld_cycle = current_cycle
+    ld_dst = rt
+
+
+def _ldursw_rm(insn):
+    global cycle_count, ld_cycle, ld_dst
+    rt, rn, rm = insn.rd, insn.rn, insn.rm
+    if ld_dst == rn or ld_dst == rm:
+        ld_delta = current_cycle - ld_cycle
+        if ld_delta <= 2:
+            cycle_count += ld_delta
+    addr = reg_vals[rn] + reg_vals[rm]
+    # check for out of bounds mem access
+    if not (reg_vals[REG_SP] <= addr <= len(mem) - 4):
+        raise ValueError("out of bounds memory access: {} at {}".format(insn.line, addr))
+    # load 4 byte starting at addr and convert to int
+    reg_vals[rt] = unpack_sword(mem, addr)[0]
+    ld_cycle = current_cycle
+    ld_dst = rt
+
+
+'''ldurh instructions'''
+
+
+def _ldurh_rn(insn):
+    global cycle_count, ld_cycle, ld_dst
+    rt, rn = insn.rd, insn.rn
+    if ld_dst == rn and (current_cycle - ld_cycle) <= 2:
+        cycle_count += 1
+    addr = reg_vals[rn]
+    # check for out of bounds mem access
+    if not (reg_vals[REG_SP] <= addr <= len(mem) - 2):
+        raise ValueError("out of bounds memory access: {}".format(insn.line))
+    # load 2 bytes starting at addr and convert to int
+    reg_vals[rt] = (unpack_shword if insn.signed else unpack_hword)(mem, addr)[0]
+    ld_cycle = current_cycle
+    ld_dst = rt
+
+
+def _ldurh_imm(insn):
+    global cycle_count, ld_cycle, ld_dst
+    rt, rn = insn.rd, insn.rn
+    if ld_dst == rn:
+        ld_delta = current_cycle - ld_cycle
+        if ld_delta <= 2:
+            cycle_count += ld_delta
+    addr = reg_vals[rn] + insn.imm
+    # check for out of bounds mem access
+    if not (reg_vals[REG_SP] <= addr <= len(mem) - 2):
+        raise ValueError("out of bounds memory access: {}".format(insn.line))
+    # load 2 byte starting at addr and convert to int
+    reg_vals[rt] = (unpack_shword if insn.signed else unpack_hword)(mem, addr)[0]
+    ld_cycle = current_cycle
+    ld_dst = rt
+
+
+def _ldurh_rm(insn):
+    global cycle_count, ld_cycle, ld_dst
+    rt, rn, rm = insn.rd, insn.rn, insn.rm
+    if ld_dst == rn or ld_dst == rm:
+        ld_delta = current_cycle - ld_cycle
+        if ld_delta <= 2:
+            cycle_count += ld_delta
+    addr = reg_vals[rn] + reg_vals[rm]
+    # check for out of bounds mem access
+    if not (reg_vals[REG_SP] <= addr <= len(mem) - 2):
+        raise ValueError("out of bounds memory access: {}".format(insn.line))
+    # load 2 byte starting at addr and convert to int
+    reg_vals[rt] = (unpack_shword if insn.signed else unpack_hword)(mem, addr)[0]
+    ld_cycle = current_cycle
+    ld_dst = rt
+
+
+'''ldurb instructions'''
+
+
+def _ldurb_rn(insn):
+    global cycle_count, ld_cycle, ld_dst
+    rt, rn = insn.rd, insn.rn
+    if ld_dst == rn and (current_cycle - ld_cycle) <= 2:
+        cycle_count += 1
+    addr = reg_vals[rn]
+    # check for out of bounds mem access
+    if not (reg_vals[REG_SP] <= addr <= len(mem) - 1):
+        raise ValueError("out of bounds memory access: {}".format(insn.line))
+    # load 1 bytes starting at addr and convert to int
+    reg_vals[rt] = (unpack_sbyte if insn.signed else unpack_byte)(mem, addr)[0]
+    ld_cycle = current_cycle
+    ld_dst = rt
+
+
+def _ldurb_imm(insn):
+    global cycle_count, ld_cycle, ld_dst
+    rt, rn = insn.rd, insn.rn
+    if ld_dst == rn and (current_cycle - ld_cycle) <= 2:
+        cycle_count += 1
+    addr = reg_vals[rn] + insn.imm
+    # check for out of bounds mem access
+    if not (reg_vals[REG_SP] <= addr <= len(mem) - 1):
+        raise ValueError("out of bounds memory access: {}".format(insn.line))
+    # load 1 byte starting at addr and convert to int
+    reg_vals[rt] = (unpack_sbyte if insn.signed else unpack_byte)(mem, addr)[0]
+    ld_cycle = current_cycle
+    ld_dst = rt
+
+
+def _ldurb_rm(insn):
+    global cycle_count, ld_cycle, ld_dst
+    rt, rn, rm = insn.rd, insn.rn, insn.rm
+    if ld_dst == rn or ld_dst == rm:
+        ld_delta = current_cycle - ld_cycle
+        if ld_delta <= 2:
+            cycle_count += ld_delta
+    addr = reg_vals[rn] + reg_vals[rm]
+    # check for out of bounds mem access
+    if not (reg_vals[REG_SP] <= addr <= len(mem) - 1):
+        raise ValueError("out of bounds memory access: {}".format(insn.line))
+    # load 1 byte starting at addr and convert to int
+    reg_vals[rt] = (unpack_sbyte if insn.signed else unpack_byte)(mem, addr)[0]
+    ld_cycle = current_cycle
+    ld_dst = rt
+
+
+'''
+ldur instructions
+'''
+
+
+def _ldur_var(insn):
+    global ld_cycle, ld_dst
+    reg_vals[insn.rd] = sym_table[insn.label]
+    ld_cycle = current_cycle
+    ld_dst = insn.rd
+
+
+def _ldur_rn(insn):
+    global cycle_count, ld_cycle, ld_dst
+    rt, rn = insn.rd, insn.rn
+    if ld_dst == rn and (current_cycle - ld_cycle) <= 2:
+        cycle_count += 1
+    addr = reg_vals[rn]
+    # check for out of bounds mem access
+    if not (reg_vals[REG_SP] <= addr <= len(mem) - 8):
+        raise ValueError("out of bounds memory access: {}".format(insn.line))
+    # load 8 bytes starting at addr and convert to int
+    reg_vals[rt] = unpack_dword(mem, addr)[0]
+    ld_cycle = current_cycle
+    ld_dst = rt
+
+
+def _ldur_imm(insn):
+    global cycle_count, ld_cycle, ld_dst
+    rt, rn = insn.rd, insn.rn
+    if ld_dst == rn and (current_cycle - ld_cycle) <= 2:
+        cycle_count += 1
+    addr = reg_vals[rn] + insn.imm
+    # check for out of bounds mem access
+    if not (reg_vals[REG_SP] <= addr <= len(mem) - 8):
+        raise ValueError("out of bounds memory access: {}".format(insn.line))
+    # load 8 bytes starting at addr and convert to int
+    reg_vals[rt] = unpack_dword(mem, addr)[0]
+    ld_cycle = current_cycle
+    ld_dst = rt
+
+
+def _ldur_rm(insn):
+    global cycle_count, ld_cycle, ld_dst
+    rt, rn, rm = insn.rd, insn.rn, insn.rm
+    if (ld_dst == rn or ld_dst == rm) and (current_cycle - ld_cycle) <= 2:
+        cycle_count += 1
+    addr = reg_vals[rn] + reg_vals[rm]
+    # check for out of bounds mem access
+    if not (reg_vals[REG_SP] <= addr <= len(mem) - 8):
+        raise ValueError("out of bounds memory access: {}".format(insn.line))
+    # load 8 bytes starting at addr and convert to int
+    reg_vals[rt] = unpack_dword(mem, addr)[0]
+    ld_cycle = current_cycle
+    ld_dst = rt
+
+
+'''sturw instruction'''
+
+
+def _sturw_rn(insn):
+    global cycle_count
+    rt, rn = insn.rd, insn.rn
+    if ld_dst == rn:
+        ld_delta = current_cycle - ld_cycle
+        if ld_delta <= 2:
+            cycle_count += ld_delta
+    addr = reg_vals[rn]
+    # check for out of bounds mem access
+    if not (reg_vals[REG_SP] <= addr <= len(mem) - 4):
+        raise ValueError("out of bounds memory access: {}".format(insn.line))
+    pack_word(mem, addr, reg_vals[rt] & 0xFFFFFFFF)
+
+
+def _sturw_imm(insn):
+    global cycle_count
+    rt, rn = insn.rd, insn.rn
+    if ld_dst == rn:
+        ld_delta = current_cycle - ld_cycle
+        if ld_delta <= 2:
+            cycle_count += ld_delta
+    addr = reg_vals[rn] + insn.imm
+    # check for out of bounds mem access
+    if not (reg_vals[REG_SP] <= addr <= len(mem) - 4):
+        raise ValueError("out of bounds memory access: {}".format(insn.line))
+    pack_word(mem, addr, reg_vals[rt] & 0xFFFFFFFF)
+
+
+def _sturw_rm(insn):
+    global cycle_count
+    rt, rn, rm = insn.rd, insn.rn, insn.rm
+    if (ld_dst == rn or ld_dst == rm) and (current_cycle - ld_cycle <= 2):
+        cycle_count += 1
+    addr = reg_vals[rn] + reg_vals[rm]
+    # check for out of bounds mem access
+    if not (reg_vals[REG_SP] <= addr <= len(mem) - 4):
+        raise ValueError("out of bounds memory access: {}".format(insn.line))
+    pack_word(mem, addr, reg_vals[rt] & 0xFFFFFFFF)
+
+
+'''sturh instruction'''
+
+
+def _sturh_rn(insn):
+    global cycle_count
+    rt, rn = insn.rd, insn.rn
+    if ld_dst == rn:
+        ld_delta = current_cycle - ld_cycle
+        if ld_delta <= 2:
+            cycle_count += ld_delta
+    addr = reg_vals[rn]
+    # check for out of bounds mem access
+    if not (reg_vals[REG_SP] <= addr <= len(mem) - 2):
+        raise ValueError("out of bounds memory access: {}".format(insn.line))
+    pack_hword(mem, addr, reg_vals[rt] & 0xFFFF)
+
+
+def _sturh_imm(insn):
+    global cycle_count
+    rt, rn = insn.rd, insn.rn
+    if ld_dst == rn:
+        ld_delta = current_cycle - ld_cycle
+        if ld_delta <= 2:
+            cycle_count += ld_delta
+    addr = reg_vals[rn] + insn.imm
+    # check for out of bounds mem access
+    if not (reg_vals[REG_SP] <= addr <= len(mem) - 2):
+        raise ValueError("out of bounds memory access: {}".format(insn.line))
+    pack_hword(mem, addr, reg_vals[rt] & 0xFFFF)
+
+
+def _sturh_rm(insn):
+    global cycle_count
+    rt, rn, rm = insn.rd, insn.rn, insn.rm
+    if (ld_dst == rn or ld_dst == rm) and (current_cycle - ld_cycle <= 2):
+        cycle_count += 1
+    addr = reg_vals[rn] + reg_vals[rm]
+    # check for out of bounds mem access
+    if not (reg_vals[REG_SP] <= addr <= len(mem) - 2):
+        raise ValueError("out of bounds memory access: {}".format(insn.line))
+    pack_hword(mem, addr, reg_vals[rt] & 0xFFFF)
+
+
+'''sturb instruction'''
+
+
+def _sturb_rn(insn):
+    global cycle_count
+    rt, rn = insn.rd, insn.rn
+    if ld_dst == rn:
+        ld_delta = current_cycle - ld_cycle
+        if ld_delta <= 2:
+            cycle_count += ld_delta
+    addr = reg_vals[rn]
+    # check for out of bounds mem access
+    if not (reg_vals[REG_SP] <= addr <= len(mem) - 1):
+        raise ValueError("out of bounds memory access: {}".format(insn.line))
+    mem[addr] = reg_vals[rt] & 0xFF
+
+
+def _sturb_imm(insn):
+    global cycle_count
+    rt, rn = insn.rd, insn.rn
+    if ld_dst == rn:
+        ld_delta = current_cycle - ld_cycle
+        if ld_delta <= 2:
+            cycle_count += ld_delta
+    addr = reg_vals[rn] + insn.imm
+    # check for out of bounds mem access
+    if not (reg_vals[REG_SP] <= addr <= len(mem) - 1):
+        raise ValueError("out of bounds memory access: {}".format(insn.line))
+    mem[addr] = reg_vals[rt] & 0xFF
+
+
+def _sturb_rm(insn):
+    global cycle_count
+    rt, rn, rm = insn.rd, insn.rn, insn.rm
+    if (ld_dst == rn or ld_dst == rm) and (current_cycle - ld_cycle <= 2):
+        cycle_count += 1
+    addr = reg_vals[rn] + reg_vals[rm]
+    # check for out of bounds mem access
+    if not (reg_vals[REG_SP] <= addr <= len(mem) - 1):
+        raise ValueError("out of bounds memory access: {}".format(insn.line))
+    mem[addr] = reg_vals[rt] & 0xFF
+
+
+'''
+stur instructions
+'''
+
+
+def _stur_rn(insn):
+    global cycle_count
+    rt, rn = insn.rd, insn.rn
+    if ld_dst == rn:
+        ld_delta = current_cycle - ld_cycle
+        if ld_delta <= 2:
+            cycle_count += ld_delta
+    addr = reg_vals[rn]
+    # check for out of bounds mem access
+    if not (reg_vals[REG_SP] <= addr <= len(mem) - 8):
+        raise ValueError("out of bounds memory access: {}".format(insn.line))
+    pack_dword(mem, addr, reg_vals[rt] & 0xFFFFFFFFFFFFFFFF)
+
+
+def _stur_imm(insn):
+    rt, rn = insn.rd, insn.rn
+    addr = reg_vals[rn] + insn.imm
+    # check for out of bounds mem access
+    if not (reg_vals[REG_SP] <= addr <= len(mem) - 8):
+        raise ValueError("out of bounds memory access: {}".format(insn.line))
+    pack_dword(mem, addr, reg_vals[rt] & 0xFFFFFFFFFFFFFFFF)
+
+
+def _stur_rm(insn):
+    global cycle_count
+    rt, rn, rm = insn.rd, insn.rn, insn.rm
+    if (ld_dst == rn or ld_dst == rm) and (current_cycle - ld_cycle <= 2):
+        cycle_count += 1
+    addr = reg_vals[rn] + reg_vals[rm]
+    # check for out of bounds mem access
+    if not (reg_vals[REG_SP] <= addr <= len(mem) - 8):
+        raise ValueError("out of bounds memory access: {}".format(insn.line))
+    pack_dword(mem, addr, reg_vals[rt] & 0xFFFFFFFFFFFFFFFF)
+
+
+'''
+mov instructions
+'''
+
+
+def _mov_imm(insn):
+    global last_dst
+    reg_vals[insn.rd] = insn.imm
+    last_dst = insn.rd
+
+
+def _mov_rn(insn):
+    global cycle_count, last_dst
+    rd, rn = insn.rd, insn.rn
+    if ld_dst == rn and (current_cycle - ld_cycle) <= 2:
+        cycle_count += 1
+    reg_vals[rd] = reg_vals[rn]
+    last_dst = rd
+
+
+'''
+arithmetic instructions
+'''
+
+
+def _asr_imm(insn):
+    global cycle_count, last_dst
+    rd, rn = insn.rd, insn.rn
+    if ld_dst == rn:
+        ld_delta = current_cycle - ld_cycle
+        if ld_delta <= 2:
+            cycle_count += ld_delta
+    reg_vals[rd] = reg_vals[rn] >> insn.imm
+    last_dst = rd
+
+
+def _asr_rm(insn):
+    global cycle_count, last_dst
+    rd, rn, rm = insn.rd, insn.rn, insn.rm
+    if (ld_dst == rn or ld_dst == rm) and (current_cycle - ld_cycle <= 2):
+        cycle_count += 1
+    reg_vals[rd] = reg_vals[rn] >> reg_vals[rm]
+    last_dst = rd
+
+
+def _lsr_imm(insn):
+    global cycle_count, last_dst
+    rd, rn = insn.rd, insn.rn
+    if ld_dst == rn:
+        ld_delta = current_cycle - ld_cycle
+        if ld_delta <= 2:
+            cycle_count += ld_delta
+    reg_vals[rd] = (reg_vals[rn] & 0xFFFFFFFFFFFFFFFF) >> insn.imm
+    last_dst = rd
+
+
+def _lsr_rm(insn):
+    global cycle_count, last_dst
+    rd, rn, rm = insn.rd, insn.rn, insn.rm
+    if (ld_dst == rn or ld_dst == rm) and (current_cycle - ld_cycle <= 2):
+        cycle_count += 1
+    reg_vals[rd] = (reg_vals[rn] & 0xFFFFFFFFFFFFFFFF) >> reg_vals[rm]
+    last_dst = rd
+
+
+# the bits that would be shifted out are masked off before the shift,
+# so the result never grows past 64 bits however far it is shifted
+def _lsl_imm(insn):
+    global cycle_count, last_dst
+    rd, rn = insn.rd, insn.rn
+    if ld_dst == rn:
+        ld_delta = current_cycle - ld_cycle
+        if ld_delta <= 2:
+            cycle_count += ld_delta
+    reg_vals[rd] = (reg_vals[rn] & (0xFFFFFFFFFFFFFFFF >> insn.imm)) << insn.imm
+    last_dst = rd
+
+
+def _lsl_rm(insn):
+    global cycle_count, last_dst
+    rd, rn, rm = insn.rd, insn.rn, insn.rm
+    if (ld_dst == rn or ld_dst == rm) and (current_cycle - ld_cycle <= 2):
+        cycle_count += 1
+    shift = reg_vals[rm]
+    reg_vals[rd] = (reg_vals[rn] & (0xFFFFFFFFFFFFFFFF >> shift)) << shift
+    last_dst = rd
+
+
+def _add_imm(insn):
+    global cycle_count, last_dst, n_flag, z_flag, flag_cycle
+    rd, rn = insn.rd, insn.rn
+    if ld_dst == rn and (current_cycle - ld_cycle <= 1):
+        cycle_count += 1
+    result = reg_vals[rn] + insn.imm
+    reg_vals[rd] = result
+    if (insn.set_flags):
+        n_flag = result < 0
+        z_flag = result == 0
         flag_cycle = current_cycle
-        last_dst = rn
-        return
-    # cmp rn, imm
-    if (re.match('cmp {},{}$'.format(rg, num), line)):
-        rn = re.findall(rg, line)[0]
-        if (ld_dst == rn) and (current_cycle - ld_cycle <= 2):
-            cycle_count += 1
-        imm = int(re.findall(num, line)[-1], 0)
-        z_flag = True if reg[rn] == imm else False
-        n_flag = True if reg[rn] < imm else False
+    last_dst = rd
+
+
+def _add_rm(insn):
+    global cycle_count, last_dst, n_flag, z_flag, flag_cycle
+    rd, rn, rm = insn.rd, insn.rn, insn.rm
+    if (ld_dst == rn or ld_dst == rm) and (current_cycle - ld_cycle <= 2):
+        cycle_count += 1
+    result = reg_vals[rn] + reg_vals[rm]
+    reg_vals[rd] = result
+    if (insn.set_flags):
+        n_flag = result < 0
+        z_flag = result == 0
         flag_cycle = current_cycle
-        last_dst = rn
-        return
-    '''
-    logical instructions
-    '''
-    # and{s} rd, rn, imm
-    if (re.match('ands? {},{},{}$'.format(rg, rg, num), line)):
-        rd = re.findall(rg, line)[0]
-        rn = re.findall(rg, line)[1]
-        if ld_dst == rn and (current_cycle - ld_cycle <= 2):
-            cycle_count += (current_cycle - ld_cycle)
-        imm = int(re.findall(num, line)[-1], 0)
-        reg[rd] = reg[rn] & imm
-        if ('ands' in line):
-            n_flag = True if (reg[rd] < 0) else False
-            z_flag = True if (reg[rd] == 0) else False
-            flag_cycle = current_cycle
-        last_dst = rd
-        return
-    # and{s} rd, rn, rm
-    if (re.match('ands? {},{},{}$'.format(rg, rg, rg), line)):
-        rd = re.findall(rg, line)[0]
-        rn = re.findall(rg, line)[1]
-        rm = re.findall(rg, line)[2]
-        if (ld_dst == rn or ld_dst == rm) and (current_cycle - ld_cycle <= 2):
-            cycle_count += 1
-        reg[rd] = reg[rn] & reg[rm]
-        if ('ands' in line):
-            n_flag = True if (reg[rd] < 0) else False
-            z_flag = True if (reg[rd] == 0) else False
-            flag_cycle = current_cycle
-        last_dst = rd
-        return
-    # orr{s} rd, rn, imm
-    if (re.match('orrs? {},{},{}$'.format(rg, rg, num), line)):
-        rd = re.findall(rg, line)[0]
-        rn = re.findall(rg, line)[1]
-        if ld_dst == rn and (current_cycle - ld_cycle <= 2):
-            cycle_count += (current_cycle - ld_cycle)
-        imm = int(re.findall(num, line)[-1], 0)
-        reg[rd] = reg[rn] | imm
-        if ('orrs' in line):
-            n_flag = True if (reg[rd] < 0) else False
-            z_flag = True if (reg[rd] == 0) else False
-            flag_cycle = current_cycle
-        last_dst = rd
-        return
-    # orr{s} rd, rn, rm
-    if (re.match('orrs? {},{},{}$'.format(rg, rg, rg), line)):
-        rd = re.findall(rg, line)[0]
-        rn = re.findall(rg, line)[1]
-        rm = re.findall(rg, line)[2]
-        if (ld_dst == rn or ld_dst == rm) and (current_cycle - ld_cycle <= 2):
-            cycle_count += 1
-        reg[rd] = reg[rn] | reg[rm]
-        if ('orrs' in line):
-            n_flag = True if (reg[rd] < 0) else False
-            z_flag = True if (reg[rd] == 0) else False
-            flag_cycle = current_cycle
-        last_dst = rd
-        return
-    # eor{s} rd, rn, imm
-    if (re.match('eors? {},{},{}$'.format(rg, rg, num), line)):
-        rd = re.findall(rg, line)[0]
-        rn = re.findall(rg, line)[1]
-        if ld_dst == rn and (current_cycle - ld_cycle <= 2):
-            cycle_count += (current_cycle - ld_cycle)
-        imm = int(re.findall(num, line)[-1], 0)
-        reg[rd] = reg[rn] ^ imm
-        if ('eors' in line):
-            n_flag = True if (reg[rd] < 0) else False
-            z_flag = True if (reg[rd] == 0) else False
-            flag_cycle = current_cycle
-        last_dst = rd
-        return
-    # eor{s} rd, rn, rm
-    if (re.match('eors? {},{},{}$'.format(rg, rg, rg), line)):
-        rd = re.findall(rg, line)[0]
-        rn = re.findall(rg, line)[1]
-        rm = re.findall(rg, line)[2]
-        if (ld_dst == rn or ld_dst == rm) and (current_cycle - ld_cycle <= 2):
-            cycle_count += 1
-        reg[rd] = reg[rn] ^ reg[rm]
-        if ('eors' in line):
-            n_flag = True if (reg[rd] < 0) else False
-            z_flag = True if (reg[rd] == 0) else False
-            flag_cycle = current_cycle
-        last_dst = rd
-        return
-    '''
-    branch instructions
-    NB. A value error is raised if a register is included where it shouldn't be
-    '''
-    # cbnz rn,<label>
-    if (re.match('cbnz {},{}$'.format(rg, lab), line)):
-        if (len(re.findall(rg, line)) != 1): raise ValueError("cbnz takes one register")
-        rn = re.findall(rg, line)[0]
-        if last_dst == rn:
-            cycle_count += 1
-        elif ld_dst == rn and (current_cycle - ld_cycle <= 2):
-            cycle_count += 3 - (current_cycle - ld_cycle)
-        # last match is the label
-        label = re.findall(lab, line)[-1]
-        if (reg[rn] != 0):
-            pc = asm.index(label + ':')
-            cycle_count += 1
-        return
-    # cbz rn, <label>
-    if (re.match('cbz {},{}$'.format(rg, lab), line)):
-        if (len(re.findall(rg, line)) != 1): raise ValueError("cbz takes one register")
-        rn = re.findall(rg, line)[0]
-        if last_dst == rn:
-            cycle_count += 1
-        elif ld_dst == rn and (current_cycle - ld_cycle <= 2):
-            cycle_count += 3 - (current_cycle - ld_cycle)
-        # last match is the label
-        label = re.findall(lab, line)[-1]
-        if (reg[rn] == 0):
-            pc = asm.index(label + ':')
-            cycle_count += 1
-        return
-    # b <label>
-    if (re.match('b {}$'.format(lab), line)):
-        if (len(re.findall(rg, line)) != 0): raise ValueError("b takes no registers")
-        # last match is the label
-        label = re.findall(lab, line)[-1]
-        pc = asm.index(label + ':')
+    last_dst = rd
+
+
+def _sub_imm(insn):
+    global cycle_count, last_dst, n_flag, z_flag, flag_cycle
+    rd, rn = insn.rd, insn.rn
+    if ld_dst == rn:
+        ld_delta = current_cycle - ld_cycle
+        if ld_delta <= 2:
+            cycle_count += ld_delta
+    result = reg_vals[rn] - insn.imm
+    reg_vals[rd] = result
+    if (insn.set_flags):
+        n_flag = result < 0
+        z_flag = result == 0
+        flag_cycle = current_cycle
+    last_dst = rd
+
+
+def _sub_rm(insn):
+    global cycle_count, last_dst, n_flag, z_flag, flag_cycle
+    rd, rn, rm = insn.rd, insn.rn, insn.rm
+    if (ld_dst == rn or ld_dst == rm) and (current_cycle - ld_cycle <= 2):
         cycle_count += 1
-        return
-    # b.lt <label>
-    if (re.match('b\.?lt {}$'.format(lab), line)):
-        if (len(re.findall(rg, line)) != 0): raise ValueError("blt takes no registers")
-        # last match is the label
-        label = re.findall(lab, line)[-1]
-        if (current_cycle - flag_cycle <= 1):
-            cycle_count += 1
-        if (n_flag):
-            pc = asm.index(label + ':')
-            cycle_count += 1
-        return
-    # b.le <label>
-    if (re.match('b\.?le {}$'.format(lab), line)):
-        if (len(re.findall(rg, line)) != 0): raise ValueError("ble takes no registers")
-        # last match is the label
-        label = re.findall(lab, line)[-1]
-        if (current_cycle - flag_cycle <= 1):
-            cycle_count += 1
-        if (n_flag or z_flag):
-            pc = asm.index(label + ':')
-            cycle_count += 1
-        return
-    # b.gt <label>
-    if (re.match('b\.?gt {}$'.format(lab), line)):
-        if (len(re.findall(rg, line)) != 0): raise ValueError("bgt takes no registers")
-        # last match is the label
-        label = re.findall(lab, line)[-1]
-        if (current_cycle - flag_cycle <= 1):
-            cycle_count += 1
-        if (not z_flag and not n_flag):
-            pc = asm.index(label + ':')
-            cycle_count += 1
-        return
-    # b.ge <label>
-    if (re.match('b\.?ge {}$'.format(lab), line)):
-        if (len(re.findall(rg, line)) != 0): raise ValueError("bge takes no registers")
-        # last match is the label
-        label = re.findall(lab, line)[-1]
-        if (current_cycle - flag_cycle <= 1):
-            cycle_count += 1
-        if (not n_flag):
-            pc = asm.index(label + ':')
-            cycle_count += 1
-        return
-    # b.eq <label>
-    if (re.match('b\.?eq {}$'.format(lab), line)):
-        if (len(re.findall(rg, line)) != 0): raise ValueError("beq takes no registers")
-        # last match is the label
-        label = re.findall(lab, line)[-1]
-        if (current_cycle - flag_cycle <= 1):
-            cycle_count += 1
-        if (z_flag):
-            pc = asm.index(label + ':')
-            cycle_count += 1
-        return
-    # b.ne <label>
-    if (re.match('b\.?ne {}$'.format(lab), line)):
-        if (len(re.findall(rg, line)) != 0): raise ValueError("bne takes no registers")
-        # last match is the label
-        label = re.findall(lab, line)[-1]
-        if (current_cycle - flag_cycle <= 1):
-            cycle_count += 1
-        if (not z_flag):
-            pc = asm.index(label + ':')
-            cycle_count += 1
-        return
-    # b.mi <label>
-    if (re.match('b\.?mi {}$'.format(lab), line)):
-        if (len(re.findall(rg, line)) != 0): raise ValueError("bmi takes no registers")
-        # last match is the label
-        label = re.findall(lab, line)[-1]
-        if (n_flag):
-            pc = asm.index(label + ':')
-            cycle_count += 1
-        return
-    # b.pl <label>
-    if (re.match('b\.?pl {}$'.format(lab), line)):
-        if (len(re.findall(rg, line)) != 0): raise ValueError("bpl takes no registers")
-        # last match is the label
-        label = re.findall(lab, line)[-1]
-        if (current_cycle - flag_cycle <= 1):
-            cycle_count += 1
-        if (not n_flag or z_flag):
-            pc = asm.index(label + ':')
-            cycle_count += 1
-        return
-    # bl <label>
-    # bl can branch to a local assembly procedure or to an externally defined
-    # python function
-    if (re.match('bl {}$'.format(lab), line)):
-        if (len(re.findall(rg, line)) != 0): raise ValueError("bl takes no registers")
-        # last match is the label
-        label = re.findall(lab, line)[-1] + ':'
-        if (current_cycle - flag_cycle <= 1):
-            cycle_count += 1
-        reg['lr'] = pc
-        # label_hit_counts must be updated here to count procedure calls
-        if (label in label_hit_counts.keys()):
-            label_hit_counts[label] += 1
-        # behavior depends if local or external label
-        if (label in linked_labels):
-            linked_labels[label]()
-        else:
-            pc = asm.index(label)
+    result = reg_vals[rn] - reg_vals[rm]
+    reg_vals[rd] = result
+    if (insn.set_flags):
+        n_flag = result < 0
+        z_flag = result == 0
+        flag_cycle = current_cycle
+    last_dst = rd
+
+
+def _mul(insn):
+    global cycle_count, last_dst
+    rd, rn, rm = insn.rd, insn.rn, insn.rm
+    if (ld_dst == rn or ld_dst == rm) and (current_cycle - ld_cycle <= 2):
         cycle_count += 1
-        return
-    # br lr
-    if (re.match('br lr$', line)):
-        addr = reg['lr']
-        if (addr not in range(0, len(asm))):
-            raise ValueError("ret: address in LR ({}) out of range".format(addr))
-        pc = addr
+    reg_vals[rd] = reg_vals[rn] * reg_vals[rm]
+    last_dst = rd
+    cycle_count += 4
+
+
+# For now treat un/signed division the same, since everything
+# is signed in python, but separate in case this changes
+def _udiv(insn):
+    global cycle_count, last_dst
+    rd, rn, rm = insn.rd, insn.rn, insn.rm
+    if (ld_dst == rn or ld_dst == rm) and (current_cycle - ld_cycle <= 2):
         cycle_count += 1
-        return
-    '''
-    system call handler
-    Currently supported: Read and write to stdin/stdout, getrandom
-    '''
-    # svc 0
-    if (re.match('svc 0$', line)):
-        syscall = int(reg['x8'])
-        # simulate exit by causing main loop to exit
-        if (syscall == 93):
-            pc = len(asm)
-        # write
-        elif (syscall == 64):
-            assert reg['x0'] == 1, "Can only write to stdout! (x0 must contain #1)"
-            length = reg['x2']
-            addr = reg['x1']
-            output = bytes(mem[addr:addr + length]).decode('ascii')
-            # if the user wants to print a newline they have to include
-            # it in their string
-            print(output, end='')
-        # read
-        elif (syscall == 63):
-            length = reg['x2']
-            addr = reg['x1']
-            enter = input()
-            enter += '\n'
-            # truncate input based on # of chars read
-            enter = enter[:length]
-            # store as bytes, not string
-            mem[addr:addr + len(enter)] = list(bytes(enter, 'ascii'))
-            # return value is # of bytes read
-            reg['x0'] = len(enter)
-        # brk
-        elif (syscall == 214):
-            new_brk = reg['x0']
-            # invalid new_brk, return current brk
-            if (new_brk < original_break):
-                reg['x0'] = brk
-            # original brk, reset heap_pointer (works with empty data section)
-            elif (new_brk == original_break):
-                brk = new_brk
-                reg['x0'] = brk
-                mem = mem[:original_break]
-            # adjust brk
-            else:
-                # round up to the nearest page boundary of 4K bytes
-                break_size = new_brk - original_break
-                assert break_size >= 0, "System error: break_size should never be negative"
-                page = (break_size + 0x1000) - break_size % 0x1000
-                if (page > HEAP_SIZE): raise ValueError("break size of {} too large".format(break_size))
-                # shink the heap
-                if (len(mem) > page + original_break):
-                    mem = mem[:page + original_break]
-                # grow the heap
-                else:
-                    mem.extend([0] * page)
-                # x0 has valid address, set brk to it
-                brk = reg['x0']
-        # getrandom
-        elif (syscall == 278):
-            addr = reg['x0']
-            quantity = reg['x1']
-            # the number of random bytes requested is written to mem
-            mem[addr:addr + quantity] = list(os.urandom(quantity))
-            reg['x0'] = quantity
+    # IMPORTANT: use integer division, not floating point
+    reg_vals[rd] = reg_vals[rn] // reg_vals[rm]
+    last_dst = rd
+
+
+def _sdiv(insn):
+    global cycle_count, last_dst
+    rd, rn, rm = insn.rd, insn.rn, insn.rm
+    if (ld_dst == rn or ld_dst == rm) and (current_cycle - ld_cycle <= 2):
+        cycle_count += 1
+    # IMPORTANT: use integer division, not floating point
+    reg_vals[rd] = reg_vals[rn] // reg_vals[rm]
+    last_dst = rd
+
+
+'''
+compare instructions
+'''
+
+
+def _cmp_rm(insn):
+    global cycle_count, last_dst, n_flag, z_flag, flag_cycle
+    rn, rm = insn.rn, insn.rm
+    if (ld_dst == rn or ld_dst == rm) and (current_cycle - ld_cycle <= 2):
+        cycle_count += 1
+    assert rm != REG_SP, "2nd register in cmp can't be sp"
+    result = reg_vals[rn] - reg_vals[rm]
+    z_flag = result == 0
+    n_flag = result < 0
+    flag_cycle = current_cycle
+    last_dst = rn
+
+
+def _cmp_imm(insn):
+    global cycle_count, last_dst, n_flag, z_flag, flag_cycle
+    rn = insn.rn
+    if (ld_dst == rn) and (current_cycle - ld_cycle <= 2):
+        cycle_count += 1
+    result = reg_vals[rn] - insn.imm
+    z_flag = result == 0
+    n_flag = result < 0
+    flag_cycle = current_cycle
+    last_dst = rn
+
+
+'''
+logical instructions
+'''
+
+
+def _and_imm(insn):
+    global cycle_count, last_dst, n_flag, z_flag, flag_cycle
+    rd, rn = insn.rd, insn.rn
+    if ld_dst == rn:
+        ld_delta = current_cycle - ld_cycle
+        if ld_delta <= 2:
+            cycle_count += ld_delta
+    result = reg_vals[rn] & insn.imm
+    reg_vals[rd] = result
+    if (insn.set_flags):
+        n_flag = result < 0
+        z_flag = result == 0
+        flag_cycle = current_cycle
+    last_dst = rd
+
+
+def _and_rm(insn):
+    global cycle_count, last_dst, n_flag, z_flag, flag_cycle
+    rd, rn, rm = insn.rd, insn.rn, insn.rm
+    if (ld_dst == rn or ld_dst == rm) and (current_cycle - ld_cycle <= 2):
+        cycle_count += 1
+    result = reg_vals[rn] & reg_vals[rm]
+    reg_vals[rd] = result
+    if (insn.set_flags):
+        n_flag = result < 0
+        z_flag = result == 0
+        flag_cycle = current_cycle
+    last_dst = rd
+
+
+def _orr_imm(insn):
+    global cycle_count, last_dst, n_flag, z_flag, flag_cycle
+    rd, rn = insn.rd, insn.rn
+    if ld_dst == rn:
+        ld_delta = current_cycle - ld_cycle
+        if ld_delta <= 2:
+            cycle_count += ld_delta
+    result = reg_vals[rn] | insn.imm
+    reg_vals[rd] = result
+    if (insn.set_flags):
+        n_flag = result < 0
+        z_flag = result == 0
+        flag_cycle = current_cycle
+    last_dst = rd
+
+
+def _orr_rm(insn):
+    global cycle_count, last_dst, n_flag, z_flag, flag_cycle
+    rd, rn, rm = insn.rd, insn.rn, insn.rm
+    if (ld_dst == rn or ld_dst == rm) and (current_cycle - ld_cycle <= 2):
+        cycle_count += 1
+    result = reg_vals[rn] | reg_vals[rm]
+    reg_vals[rd] = result
+    if (insn.set_flags):
+        n_flag = result < 0
+        z_flag = result == 0
+        flag_cycle = current_cycle
+    last_dst = rd
+
+
+def _eor_imm(insn):
+    global cycle_count, last_dst, n_flag, z_flag, flag_cycle
+    rd, rn = insn.rd, insn.rn
+    if ld_dst == rn:
+        ld_delta = current_cycle - ld_cycle
+        if ld_delta <= 2:
+            cycle_count += ld_delta
+    result = reg_vals[rn] ^ insn.imm
+    reg_vals[rd] = result
+    if (insn.set_flags):
+        n_flag = result < 0
+        z_flag = result == 0
+        flag_cycle = current_cycle
+    last_dst = rd
+
+
+def _eor_rm(insn):
+    global cycle_count, last_dst, n_flag, z_flag, flag_cycle
+    rd, rn, rm = insn.rd, insn.rn, insn.rm
+    if (ld_dst == rn or ld_dst == rm) and (current_cycle - ld_cycle <= 2):
+        cycle_count += 1
+    result = reg_vals[rn] ^ reg_vals[rm]
+    reg_vals[rd] = result
+    if (insn.set_flags):
+        n_flag = result < 0
+        z_flag = result == 0
+        flag_cycle = current_cycle
+    last_dst = rd
+
+
+'''
+branch instructions
+The target pc is set to the index of the label, the main loop
+then increments pc past it. The index is looked up when the
+instruction is decoded
+'''
+
+
+def _cbnz(insn):
+    global cycle_count, pc
+    rn = insn.rn
+    if last_dst == rn:
+        cycle_count += 1
+    elif ld_dst == rn:
+        ld_delta = current_cycle - ld_cycle
+        if ld_delta <= 2:
+            cycle_count += 3 - ld_delta
+    if (reg_vals[rn] != 0):
+        pc = insn.target
+        cycle_count += 1
+
+
+def _cbz(insn):
+    global cycle_count, pc
+    rn = insn.rn
+    if last_dst == rn:
+        cycle_count += 1
+    elif ld_dst == rn:
+        ld_delta = current_cycle - ld_cycle
+        if ld_delta <= 2:
+            cycle_count += 3 - ld_delta
+    if (reg_vals[rn] == 0):
+        pc = insn.target
+        cycle_count += 1
+
+
+def _b(insn):
+    global cycle_count, pc
+    pc = insn.target
+    cycle_count += 1
+
+
+'''
+Conditional branches. There is one handler per condition instead of
+one handler that looks the condition up in a table, since the handlers
+are also the source of the generated code (see handler_source()), which
+then tests the flags inline. The decoders share one table of conditions
+'''
+
+
+def _b_lt(insn):
+    global cycle_count, pc
+    if (current_cycle - flag_cycle <= 1):
+        cycle_count += 1
+    if (n_flag):
+        pc = insn.target
+        cycle_count += 1
+
+
+def _b_le(insn):
+    global cycle_count, pc
+    if (current_cycle - flag_cycle <= 1):
+        cycle_count += 1
+    if (n_flag or z_flag):
+        pc = insn.target
+        cycle_count += 1
+
+
+def _b_gt(insn):
+    global cycle_count, pc
+    if (current_cycle - flag_cycle <= 1):
+        cycle_count += 1
+    if (not (n_flag or z_flag)):
+        pc = insn.target
+        cycle_count += 1
+
+
+def _b_ge(insn):
+    global cycle_count, pc
+    if (current_cycle - flag_cycle <= 1):
+        cycle_count += 1
+    if (not n_flag):
+        pc = insn.target
+        cycle_count += 1
+
+
+def _b_eq(insn):
+    global cycle_count, pc
+    if (current_cycle - flag_cycle <= 1):
+        cycle_count += 1
+    if (z_flag):
+        pc = insn.target
+        cycle_count += 1
+
+
+def _b_ne(insn):
+    global cycle_count, pc
+    if (current_cycle - flag_cycle <= 1):
+        cycle_count += 1
+    if (not z_flag):
+        pc = insn.target
+        cycle_count += 1
+
+
+def _b_mi(insn):
+    global cycle_count, pc
+    if (n_flag):
+        pc = insn.target
+        cycle_count += 1
+
+
+def _b_pl(insn):
+    global cycle_count, pc
+    if (current_cycle - flag_cycle <= 1):
+        cycle_count += 1
+    if (not n_flag or z_flag):
+        pc = insn.target
+        cycle_count += 1
+
+
+# bl can branch to a local assembly procedure or to an externally defined
+# python function
+def _bl(insn):
+    global cycle_count, pc
+    label = insn.label + ':'
+    if (current_cycle - flag_cycle <= 1):
+        cycle_count += 1
+    # This checks for recursion by determining if the current pc
+    # is saved in the link register at the time of a bl instr. If so,
+    # this is the 2nd time this bl instr has been reached.
+    # Will not detect a recursive procedure if termination condition
+    # is immediately met.
+    if (reg_vals[REG_LR] == pc):
+        recursed_labels.add(insn.label)
+    reg_vals[REG_LR] = pc
+    # label_hit_counts must be updated here to count procedure calls
+    if (label in label_hit_counts):
+        label_hit_counts[label] += 1
+    # behavior depends if local or external label
+    if (label in linked_labels):
+        linked_labels[label]()
+    else:
+        target = insn.target
+        pc = target if target is not None else label_pc(label)
+    cycle_count += 1
+
+
+def _br_lr(insn):
+    global cycle_count, pc
+    addr = reg_vals[REG_LR]
+    if (addr not in range(0, len(asm))):
+        raise ValueError("ret: address in LR ({}) out of range".format(addr))
+    pc = addr
+    cycle_count += 1
+
+
+'''
+system call handler
+Currently supported: Read and write to stdin/stdout, getrandom
+'''
+
+
+def _svc(insn):
+    global pc, brk
+    syscall = int(reg_vals[8])
+    # simulate exit by causing main loop to exit
+    if (syscall == 93):
+        pc = len(asm)
+    # write
+    elif (syscall == 64):
+        assert reg_vals[0] == 1, "Can only write to stdout! (x0 must contain #1)"
+        length = reg_vals[2]
+        addr = reg_vals[1]
+        # if the user wants to print a newline they have to include
+        # it in their string. The text is decoded from a view of mem
+        # rather than a copy of it; the view is released right away
+        # since mem can't be resized while a view of it exists
+        with memoryview(mem) as view:
+            sys.stdout.write(str(view[addr:addr + length], 'ascii'))
+    # read
+    elif (syscall == 63):
+        length = reg_vals[2]
+        addr = reg_vals[1]
+        enter = input()
+        enter += '\n'
+        # truncate input based on # of chars read
+        enter = enter[:length]
+        # store as bytes, not string
+        mem[addr:addr + len(enter)] = enter.encode('ascii')
+        # return value is # of bytes read
+        reg_vals[0] = len(enter)
+    # brk
+    elif (syscall == 214):
+        new_brk = reg_vals[0]
+        # invalid new_brk, return current brk
+        if (new_brk < original_break):
+            reg_vals[0] = brk
+        # original brk, reset heap_pointer (works with empty data section)
+        elif (new_brk == original_break):
+            brk = new_brk
+            reg_vals[0] = brk
+            del mem[original_break:]
+        # adjust brk
         else:
-            raise ValueError("Unsupported system call: {} ".format(syscall))
-        return
-    raise ValueError("Unsupported instruction or syntax error: " + line)
+            # round up to the next page boundary of 4K bytes (a whole
+            # page is added if break_size is already on a boundary)
+            break_size = new_brk - original_break
+            assert break_size >= 0, "System error: break_size should never be negative"
+            page = (break_size | 0xFFF) + 1
+            if (page > HEAP_SIZE): raise ValueError("break size of {} too large".format(break_size))
+            # shink the heap
+            if (len(mem) > page + original_break):
+                del mem[page + original_break:]
+            # grow the heap
+            else:
+                mem.extend(bytes(page))
+            # x0 has valid address, set brk to it
+            brk = reg_vals[0]
+    # getrandom
+    elif (syscall == 278):
+        addr = reg_vals[0]
+        quantity = reg_vals[1]
+        # the number of random bytes requested is written to mem
+        mem[addr:addr + quantity] = os.urandom(quantity)
+        reg_vals[0] = quantity
+    else:
+        raise ValueError("Unsupported system call: {} ".format(syscall))
+
+
+# handler for each opcode, indexed by opcode
+HANDLERS = (
+    _invalid,  # OP_LABEL
+    _invalid,  # OP_INVALID
+    _ldursw_rn, _ldursw_imm, _ldursw_rm,
+    _ldurh_rn, _ldurh_imm, _ldurh_rm,
+    _ldurb_rn, _ldurb_imm, _ldurb_rm,
+    _ldur_var, _ldur_rn, _ldur_imm, _ldur_rm,
+    _sturw_rn, _sturw_imm, _sturw_rm,
+    _sturh_rn, _sturh_imm, _sturh_rm,
+    _sturb_rn, _sturb_imm, _sturb_rm,
+    _stur_rn, _stur_imm, _stur_rm,
+    _mov_imm, _mov_rn,
+    _asr_imm, _asr_rm,
+    _lsr_imm, _lsr_rm,
+    _lsl_imm, _lsl_rm,
+    _add_imm, _add_rm,
+    _sub_imm, _sub_rm,
+    _mul, _udiv, _sdiv,
+    _cmp_rm, _cmp_imm,
+    _and_imm, _and_rm,
+    _orr_imm, _orr_rm,
+    _eor_imm, _eor_rm,
+    _cbnz, _cbz, _b,
+    _b_lt, _b_le, _b_gt, _b_ge, _b_eq, _b_ne, _b_mi, _b_pl,
+    _bl, _br_lr, _svc,
+)
+assert len(HANDLERS) == OP_SVC + 1, "every opcode needs a handler"
+
+
+'''
+Generated code. Instead of looking up the handler of every instruction
+each time it is executed, run() calls a function that is generated for
+that instruction from the source of its handler. The operands are
+written into the source as constants and the counter updates done by
+execute_insn are inlined, so executing an instruction is a single call
+with no attribute or handler lookups. Since the source of the handlers
+is reused, the generated code always has the same behavior (and cycle
+counts) as the handlers.
+The body of a handler is copied line by line, so a handler can't have
+a decorator, a docstring, a signature that spans lines, or a return,
+and it can only use insn to read its fields. handler_source() checks
+this with the ast of the handler
+'''
+
+insn_attr_pattern = re.compile(r'\binsn\.(\w+)')
+# opcode -> (global names, body) of its handler, filled as they are needed
+handler_sources = {}
+
+
+def check_handler(name, source):
+    func = ast.parse(source).body[0]
+    assert not func.decorator_list, "{} can't have a decorator".format(name)
+    assert [a.arg for a in func.args.args] == ['insn'] and source.splitlines()[0].rstrip().endswith(':'), \
+        "{} must take only insn, with the signature on one line".format(name)
+    first = func.body[0]
+    assert not (isinstance(first, ast.Expr) and isinstance(first.value, ast.Constant)), \
+        "{} can't have a docstring".format(name)
+    attrs = set()
+    for node in ast.walk(func):
+        assert not isinstance(node, (ast.Return, ast.Yield, ast.YieldFrom, ast.Nonlocal)), \
+            "{} can't return or yield".format(name)
+        if isinstance(node, ast.Attribute) and isinstance(node.value, ast.Name) and node.value.id == 'insn':
+            attrs.add(id(node.value))
+    for node in ast.walk(func):
+        if isinstance(node, ast.Name) and node.id == 'insn':
+            assert id(node) in attrs, "{} can only use insn to read its fields".format(name)
+
+
+def handler_source(op):
+    if op not in handler_sources:
+        names = ['cycle_count', 'execute_count', 'current_cycle', 'last_dst']
+        body = []
+        source = inspect.getsource(HANDLERS[op])
+        check_handler(HANDLERS[op].__name__, source)
+        # skip the def line and pull the global names out of the body
+        for line in source.splitlines()[1:]:
+            if line.strip().startswith('global '):
+                names += [n.strip() for n in line.strip()[7:].split(',') if n.strip() not in names]
+            elif line.strip():
+                body.append(line)
+        handler_sources[op] = (names, '\n'.join(body))
+    return handler_sources[op]
+
+
+'''
+Returns the global names used by insn and the source that executes it,
+which is the body of its handler with the operands filled in, preceded
+by the counter updates done by execute_insn
+'''
+
+
+def insn_source(insn: Insn):
+    names, body = handler_source(insn.op)
+    body = insn_attr_pattern.sub(lambda m: repr(getattr(insn, m.group(1))), body)
+    return names, ("    current_cycle = cycle_count\n"
+                   "    cycle_count += 1\n"
+                   "    execute_count += 1\n"
+                   "    last_dst = None\n"
+                   + body)
+
+
+'''
+Compiles the source of a function named run_insn with the given global
+names and body. name is only used in tracebacks
+'''
+
+
+def compile_source(name, names, body):
+    src = "def run_insn():\n"
+    if names:
+        src += "    global {}\n".format(', '.join(names))
+    src += body + "\n"
+    namespace = {}
+    exec(compile(src, '<armsim: {}>'.format(name), 'exec'), globals(), namespace)
+    return namespace['run_insn']
+
+
+'''
+Generates the function that executes insn. Labels and lines that could
+not be decoded are left to execute_insn, since they only raise errors
+'''
+
+
+def compile_insn(insn: Insn):
+    if insn.op in (OP_LABEL, OP_INVALID):
+        return lambda: execute_insn(insn)
+    names, body = insn_source(insn)
+    return compile_source(insn.line, names, body)
+
+
+'''
+Basic blocks. A block is the straight line code that starts at a label
+or right after a branch, and runs up to and including the next branch.
+Blocks are interpreted one instruction at a time until they have been
+entered more than BLOCK_THRESHOLD times, then the whole block is
+compiled into one function that replaces the entry for its first
+instruction in compiled. A block that starts at a label counts the
+label itself, so a loop takes one call per iteration. The block stops
+before any other label, bl, or line that could not be decoded, since
+run() handles those itself.
+The block function does everything run() does between instructions:
+pc is kept up to date so that errors leave it on the failing
+instruction, xzr is reset after it is written, and the stack is
+checked after sp is written. The registers the block uses are local
+variables, which are read from reg_vals when the block is entered
+and written back when it exits
+'''
+
+BLOCK_THRESHOLD = 50
+# first pc of a block -> its compiled function
+compiled_blocks = {}
+# the value of count_label_hits when the blocks were compiled
+blocks_count_label_hits = True
+
+
+# register operands in the source of a handler: the names the handlers give
+# the decoded registers, the register constants, or a register number
+reg_ref_pattern = re.compile(r'reg_vals\[(rd|rt|rn|rm|REG_SP|REG_LR|REG_XZR|\d+)\]')
+# the highest address an access of some size can start at
+mem_bound_pattern = re.compile(r'len\(mem\) - (\d+)')
+# a register once it has been replaced by a local
+reg_name_pattern = re.compile(r'\b({})\b'.format('|'.join(REG_NAMES)))
+# assignments to a register once it has been replaced by a local
+reg_store_pattern = re.compile(r'^\s*({}) = '.format('|'.join(REG_NAMES)), re.M)
+
+
+def compile_block(start):
+    names = ['pc']
+    # the length of mem is only changed by svc, which ends the block, so
+    # the upper bound of each size of access is computed on entry
+    lines = []
+    access_sizes = set()
+    stack_check = ("    if (sp < 0):\n"
+                   "        raise ValueError(\"stack overflow\")\n"
+                   "    if (sp > STACK_SIZE):\n"
+                   "        raise ValueError(\"stack underflow (make sure to allocate space)\")\n"
+                   "    if ((sp + 1) & 15):\n"
+                   "        raise ValueError(\"Alignment error: sp must be a multiple of 16\")")
+    end = start
+    if (decoded[start].op == OP_LABEL):
+        if (count_label_hits):
+            lines.append("    label_hit_counts[{!r}] += 1".format(decoded[start].line))
+        end += 1
+    while end < len(decoded) and decoded[end].op not in (OP_LABEL, OP_INVALID, OP_BL):
+        insn = decoded[end]
+        insn_names, body = insn_source(insn)
+        names += [n for n in insn_names if n not in names]
+        lines.append("    pc = {}".format(end))
+        if end > start and decoded[end - 1].rd == REG_SP:
+            lines.append(stack_check)
+        # every register is a local named after the register
+        regs = {'rd': insn.rd, 'rt': insn.rd, 'rn': insn.rn, 'rm': insn.rm,
+                'REG_SP': REG_SP, 'REG_LR': REG_LR, 'REG_XZR': REG_XZR}
+        body = reg_ref_pattern.sub(lambda m: REG_NAMES[regs[m.group(1)] if m.group(1) in regs else int(m.group(1))],
+                                   body)
+        access_sizes.update(mem_bound_pattern.findall(body))
+        body = mem_bound_pattern.sub(r'mem_end_\1', body)
+        lines.append(body.replace('len(mem)', 'mem_len'))
+        if insn.rd == REG_XZR:
+            lines.append("    xzr = 0")
+        end += 1
+        # branches end the block
+        if insn.op >= OP_CBNZ:
+            break
+    # a single instruction is already compiled on its own
+    if end - start < 2:
+        return None
+    body = '\n'.join(lines)
+    # the globals and registers the block uses are kept in locals while it
+    # runs, and the ones it assigns are written back when it returns or raises
+    found = set(reg_name_pattern.findall(body))
+    used = [r for r in REG_NAMES if r in found]
+    stored = set(reg_store_pattern.findall(body))
+    load = (["    sim = globals()"] + ["    {0} = sim['{0}']".format(n) for n in names]
+            + ["    {} = reg_vals[{}]".format(r, REG_IDX[r]) for r in used]
+            + ["    mem_len = len(mem)"]
+            + ["    mem_end_{0} = mem_len - {0}".format(n) for n in sorted(access_sizes)])
+    store = (["        sim['{0}'] = {0}".format(n) for n in names]
+             + ["        reg_vals[{}] = {}".format(REG_IDX[r], r) for r in used if r in stored])
+    body = body.replace('\n', '\n    ')
+    return compile_source("block at {}".format(start), [],
+                          '\n'.join(load + ["    try:", "    " + body, "    finally:"] + store))
+
+
+'''
+Wraps the function for the instruction at start, the first instruction
+of a block, so that the block is compiled once it is entered more than
+BLOCK_THRESHOLD times
+'''
+
+
+def tier_up(start):
+    step = compiled[start]
+    hits = 0
+
+    def run_counted():
+        nonlocal hits
+        hits += 1
+        if hits > BLOCK_THRESHOLD:
+            block = compile_block(start)
+            if block is not None:
+                compiled_blocks[start] = block
+            compiled[start] = block if block is not None else step
+        step()
+    return run_counted
+
+
+'''
+Returns the function run() calls when it reaches the label on line. It
+only counts the label in label_hit_counts, since labels aren't executed,
+and does nothing when count_label_hits is False
+'''
+
+
+def label_counter(line: str):
+    def count_label():
+        label_hit_counts[line] += 1
+
+    def skip_label():
+        pass
+    return count_label if count_label_hits else skip_label
+
+
+'''
+Generates the function for every decoded instruction into the compiled
+list, so that compiled[pc] executes the instruction at asm[pc]. The
+first instruction of each block counts how often the block is entered.
+Called at the start of run() after decode_program(). The functions and
+blocks are kept until the next parse(), so running the same program
+again (see restart()) does not generate them again
+'''
+
+
+def compile_program():
+    global compiled, blocks_count_label_hits
+    compiled = []
+    # a block that starts at a label only counts it if count_label_hits was
+    # set when the block was compiled
+    if (blocks_count_label_hits != count_label_hits):
+        compiled_blocks.clear()
+        blocks_count_label_hits = count_label_hits
+    for line, insn in zip(asm, decoded):
+        if (insn.op == OP_LABEL):
+            compiled.append(label_counter(line))
+            continue
+        if line not in compile_cache:
+            compile_cache[line] = compile_insn(insn)
+        compiled.append(compile_cache[line])
+    for pc in range(len(decoded)):
+        if decoded[pc].op == OP_LABEL or (pc > 0 and (decoded[pc - 1].op == OP_LABEL or decoded[pc - 1].op >= OP_CBNZ)):
+            compiled[pc] = compiled_blocks[pc] if pc in compiled_blocks else tier_up(pc)
 
 
 '''
@@ -1481,46 +2246,51 @@ returns the list
 '''
 
 
+# type -> (width in bytes, unsigned struct format) of each element, for the
+# types that hold numbers
+DATA_WIDTHS = {1: (8, 'Q'), 3: (4, 'I'), 4: (2, 'H'), 5: (1, 'B')}
+
+
 def getdata(variable: str):
     if (variable + '_TYPE_' in sym_table):
         index = sym_table[variable]
         size = sym_table[variable + "_SIZE_"]
+        data_type = sym_table[variable + '_TYPE_']
         # asciz
-        if (sym_table[variable + '_TYPE_'] == 0):
-            return list(bytes(mem[index:index + size]).decode('ascii'))
-        # dword
-        elif (sym_table[variable + '_TYPE_'] == 1):
-            lst = []
-            for i in range(0, size, 8):
-                lst.append(int.from_bytes(bytes(mem[index + i:index + i + 8]), 'little'))
-            return lst
+        if (data_type == 0):
+            return list(mem[index:index + size].decode('ascii'))
         # space
-        elif (sym_table[variable + '_TYPE_'] == 2):
-            return list(bytes(mem[index:index + size]))
-        # word
-        elif (sym_table[variable + '_TYPE_'] == 3):
-            lst = []
-            for i in range(0, size, 4):
-                lst.append(int.from_bytes(bytes(mem[index + i:index + i + 4]), 'little'))
-            return lst
-        # hword
-        elif (sym_table[variable + '_TYPE_'] == 4):
-            lst = []
-            for i in range(0, size, 2):
-                lst.append(int.from_bytes(bytes(mem[index + i:index + i + 2]), 'little'))
-            return lst
-        # byte
-        elif (sym_table[variable + '_TYPE_'] == 5):
-            lst = []
-            for i in range(0, size, 1):
-                lst.append(int.from_bytes(bytes(mem[index + i:index + i + 1]), 'little'))
-            return lst
+        elif (data_type == 2):
+            return list(mem[index:index + size])
+        # dword, word, hword, byte
+        elif (data_type in DATA_WIDTHS):
+            width, fmt = DATA_WIDTHS[data_type]
+            return list(struct.unpack_from('<{}{}'.format(size // width, fmt), mem, index))
         else:
             print(variable + ': variable not found')
     else:
         return [sym_table[variable]]
 
 
+'''
+Builds label_pcs from asm. setdefault keeps the first declaration of a
+label, which is the one asm.index() would find. Lines that were decoded
+or compiled before have branch targets (and blocks have pcs) from the
+old asm, so the caches are cleared
+'''
+
+
+def index_labels():
+    label_pcs.clear()
+    for i, line in enumerate(asm):
+        if (label_line_pattern.match(line)):
+            label_pcs.setdefault(line, i)
+    indexed_asm[:] = asm
+    decode_cache.clear()
+    compile_cache.clear()
+    compiled_blocks.clear()
+
+
 '''
 Procedure to check that predefined rules about the code 
 have been adhered to
@@ -1538,58 +2308,66 @@ need to call this separately
 
 
 def check_static_rules():
-    global forbid_recursion, require_recursion, check_dead_code, label_regex
-    # label regex
-    lab = label_regex
-
     # Make sure code has been detected
     if (not asm):
         raise ValueError("no code detected (remember to include a _start: or main: label)")
-    # check for disallowed instructions:
+    # asm can be edited after parse() (the tests do this), which would
+    # leave label_pcs and the decoded program out of date
+    if (asm != indexed_asm):
+        index_labels()
+    # check for disallowed instructions (no instructions are forbidden
+    # unless some have been added, so usually there is nothing to scan):
     # --extract mnemonics (string before the first space)
-    mnemonics = [i.split(" ")[0] for i in asm if " " in i]
-    forbid = set(mnemonics).intersection(forbidden_instructions)
-    if (forbid): raise ValueError("Use of {} disallowed".format(forbid))
-
-    # verify that labels have not be redeclared
-    labels = [l for l in asm if (re.match('{}:'.format(lab), l))]
-    if (len(labels) > len(set(labels))):
-        raise ValueError("You can't declare the same label more than once")
-
-    # check that all branch instructions call existing labels
-    for instr in asm:
-        if (re.match('br lr$', instr)):
-            continue
-        if (re.match('c?b(.*?)', instr)):
-            label = re.findall(lab, instr)[-1] + ":"
-            if (label not in asm and label not in linked_labels):
-                raise ValueError(instr + " is calling a nonexistent label")
-
-    # To check for looping:
-    # --match any branch instruction except bl
-    # --if its label occurs earlier in the instruction
-    # listing than the branch, it is a loop
+    if (forbidden_instructions):
+        mnemonics = mnemonic_pattern.findall('\n'.join(asm))
+        forbid = set(mnemonics).intersection(forbidden_instructions)
+        if (forbid): raise ValueError("Use of {} disallowed".format(forbid))
+
+    # the other checks share one pass over asm. Their errors are raised
+    # after it, in the order the checks are described here
+    # --verify that labels have not be redeclared, by remembering the
+    # labels declared so far
+    # --check that all branch instructions call existing labels
+    # --to check for looping, match any branch instruction except bl
+    # and br lr. If its label occurs earlier in the instruction listing
+    # than the branch, it is a loop. label_pcs was reindexed above, so
+    # it has the positions of the labels in the current asm
+    # --check for dead code after ret or b instruction. The only instr
+    # that should come after a ret or b is a label, and nothing can
+    # follow the last instruction
+    declared = set()
+    redeclared = False
+    missing = None
     looped = False
-    if (forbid_loops):
-        for i in range(0, len(asm) - 1):
-            # match branches except for bl
-            if (re.match('c?b(?!l )', asm[i])):
-                # last match is the label
-                label = re.findall(lab, asm[i])[-1]
-                if (asm.index(label + ':') < i):
-                    looped = True
-        if (looped):
-            raise ValueError("you cannot loop")
-
-    if (check_dead_code):
-        # Check for dead code after ret or b instruction
-        # The only instr that should come after a ret or b is a label
-        for i in range(0, len(asm) - 1):
-            # don't care about last instruction
-            if (i != len(asm) - 1):
-                if (asm[i] == 'br lr' or re.match('b {}'.format(lab), asm[i])):
-                    assert re.match(lab + ':', asm[i + 1]), \
-                        "Dead code detected after instruction {} " + asm[i]
+    dead = None
+    last = len(asm) - 1
+    for i, instr in enumerate(asm):
+        if (label_line_pattern.match(instr)):
+            if (instr in declared):
+                redeclared = True
+            declared.add(instr)
+            continue
+        if (instr.startswith(('b', 'cb'))):
+            if (instr != 'br lr'):
+                # last match is the label, which can also be a linked label
+                label = label_pattern.findall(instr)[-1] + ":"
+                if (label not in label_pcs and label not in linked_labels):
+                    missing = missing or instr
+                if (forbid_loops and loop_branch_pattern.match(instr)):
+                    if (label in label_pcs and label_pcs[label] < i):
+                        looped = True
+            if (check_dead_code and dead is None and i != last):
+                if (instr == 'br lr' or b_line_pattern.match(instr)):
+                    if (not label_line_pattern.match(asm[i + 1])):
+                        dead = instr
+
+    if (redeclared):
+        raise ValueError("You can't declare the same label more than once")
+    if (missing):
+        raise ValueError(missing + " is calling a nonexistent label")
+    if (looped):
+        raise ValueError("you cannot loop")
+    assert dead is None, "Dead code detected after instruction {} " + dead
 
 
 '''
@@ -1601,40 +2379,44 @@ have ended when pc equals the length of the asm list
 
 
 def run():
-    global pc, STACK_SIZE, label_regex, label_hit_counts
+    global pc, label_hit_counts
     check_static_rules()
-    recursed_labels = set()
-    labels = [l for l in asm if (re.match('{}:'.format(label_regex), l))] + list(linked_labels.keys())
-    label_hit_counts = dict(zip(labels, [0] * len(labels)))
-    while pc < len(asm):
-        line = asm[pc]
-        # This checks for recursion by determining if the current pc
-        # is saved in the link register at the time of a bl instr. If so,
-        # this is the 2nd time this bl instr has been reached.
-        # Will not detect a recursive procedure if termination condition
-        # is immediately met.
-        if (re.match('bl {}'.format(label_regex), line)):
-            if (pc == reg['lr']):
-                # last match is the label
-                label = re.findall(label_regex, line)[-1]
-                recursed_labels.add(label)
-
+    recursed_labels.clear()
+    labels = list(label_pcs.keys()) + list(linked_labels.keys())
+    label_hit_counts = dict.fromkeys(labels, 0) if count_label_hits else {}
+    decode_program()
+    compile_program()
+    # asm does not change while the program runs, so the lists built
+    # from it and the constants the loop uses can be read through locals.
+    # pc stays a global since the instructions update it
+    end = len(asm)
+    code = compiled
+    regs = reg_vals
+    stack_size = STACK_SIZE
+    sp_index, xzr_index = REG_SP, REG_XZR
+    # the stack only has to be checked before the first instruction and
+    # after the instructions that can change sp. bl counts as one since
+    # it can call a linked python function. When code[pc]() returns, pc
+    # is on the last instruction that ran, even if it ran a whole block.
+    # A branch can leave pc past the end, so a set is used instead of a list
+    writes_sp = {i for i, insn in enumerate(decoded) if insn.rd == REG_SP or insn.op == OP_BL}
+    check_sp = True
+    while pc < end:
         # check for stack errors
-        if (reg['sp'] < 0):
-            raise ValueError("stack overflow")
-        if (reg['sp'] > STACK_SIZE):
-            raise ValueError("stack underflow (make sure to allocate space)")
-        if ((reg['sp'] + 1) % 16 != 0):
-            raise ValueError("Alignment error: sp must be a multiple of 16")
-
-        # if a label in encountered, inc pc and skip
-        # also update label_hit_counts
-        if (re.match(label_regex + ':', line)):
-            pc += 1;
-            label_hit_counts[line] += 1
-            continue
-        execute(line)
-        reg['xzr'] = 0
+        if (check_sp):
+            sp = regs[sp_index]
+            if (sp < 0):
+                raise ValueError("stack overflow")
+            if (sp > stack_size):
+                raise ValueError("stack underflow (make sure to allocate space)")
+            if ((sp + 1) & 15):
+                raise ValueError("Alignment error: sp must be a multiple of 16")
+
+        # labels have a function too (see label_counter() and
+        # compile_block()), so every line is run the same way
+        code[pc]()
+        regs[xzr_index] = 0
+        check_sp = pc in writes_sp
         pc += 1
     # empty recursed_labels list means no recursion happened
     if (recursed_labels and forbid_recursion):
@@ -1643,8 +2425,8 @@ def run():
         raise ValueError("recursion did not occur in program but it should have")
     # case where there was recursion, but not for the labels specified
     # in the recursive_labels list. (recursive_labels should be a subset
-    # of recursed_labels)
-    if (recursed_labels and recursive_labels - recursed_labels):
+    # of recursed_labels, which <= tests without building the difference)
+    if (recursed_labels and not recursive_labels <= recursed_labels):
         raise ValueError("recursive calls do not include required call to {}".format(recursive_labels))
 
 
@@ -1656,7 +2438,7 @@ and affected registers after executing each instruction.
 
 
 def repl():
-    global n_flag, z_flag, register_regex
+    global n_flag, z_flag
     print('armsim repl. operations on memory not supported\ntype q to quit')
     instr = ''
     while (True):
@@ -1666,9 +2448,10 @@ def repl():
         if (not instr): continue
         try:
             execute(instr)
-            for r in set(re.findall(register_regex, instr)):
+            # each register used by the instruction, in the order it appears
+            for r in dict.fromkeys(register_pattern.findall(instr)):
                 print("{}: {}".format(r, reg[r]))
-            print("Z: {} N: {}".format(n_flag, z_flag))
+            print("Z: {} N: {}".format(z_flag, n_flag))
         except ValueError as e:
             print(e)
     return
@@ -1680,20 +2463,31 @@ A procedure to return the simulator to it's initial state
 
 
 def reset():
-    global reg, z_flag, n_flag, pc
+    global z_flag, n_flag, pc
     global require_recursion, forbid_recursion, forbid_loops
     global cycle_count, execute_count
     global ld_cycle, ld_dst
     global flag_cycle, last_dst
-    global linked_labels
+    global linked_labels, count_label_hits
     forbidden_instructions.clear()
     require_recursion = False
     forbid_recursion = False
     forbid_loops = False
-    reg = {r: 0 for r in reg}
+    count_label_hits = True
+    reg_vals[:] = [0] * len(reg_vals)
     mem.clear()
     asm.clear()
     sym_table.clear()
+    parsed_mem.clear()
+    parsed_reg.clear()
+    label_pcs.clear()
+    indexed_asm.clear()
+    decoded.clear()
+    recursed_labels.clear()
+    decode_cache.clear()
+    compiled.clear()
+    compile_cache.clear()
+    compiled_blocks.clear()
     n_flag = False;
     z_flag = False
     pc = 0
@@ -1705,6 +2499,33 @@ def reset():
     linked_labels = {}
 
 
+'''
+A procedure to return the simulator to the state it was in right after
+parse() so that the same program can be run again (e.g. on different
+input data) without parsing it again. Unlike reset(), the program,
+sym_table, linked_labels, and the static check settings are kept
+'''
+
+
+def restart():
+    global z_flag, n_flag, pc, brk
+    global cycle_count, execute_count
+    global ld_cycle, ld_dst
+    global flag_cycle, last_dst
+    # mem and reg_vals are updated in place so that aliases to them stay valid
+    mem[:] = parsed_mem
+    reg_vals[:] = parsed_reg
+    brk = original_break
+    n_flag = False
+    z_flag = False
+    pc = 0
+    cycle_count = 0
+    execute_count = 0
+    ld_cycle, ld_dst = -1, -1
+    flag_cycle = -1
+    last_dst = -1
+
+
 def main():
     if (not sys.argv[1:]):
         repl()
@@ -1,5 +1,6 @@
 import armsim
 import random
+import struct
 import sys
 
 
@@ -46,11 +47,9 @@ def main():
 
 
 def randomize_matrix(matrix_address: int, n: int, min_value: int = 0, max_value: int = 10):
-    length = n * n * 8
-    for offset in range(0, length, 8):
-        element_address = matrix_address + offset
-        value = random.randint(min_value, max_value)
-        armsim.mem[element_address:element_address + 8] = value.to_bytes(8, byteorder='little')
+    values = [random.randint(min_value, max_value) for _ in range(n * n)]
+    # pack every element into one buffer and write it with a single slice
+    armsim.mem[matrix_address:matrix_address + n * n * 8] = struct.pack(f'<{n * n}Q', *values)
 
 
 def print_matrix(label: str, matrix: list[list[int]]):
@@ -1,5 +1,6 @@
 import armsim
 from simple_cnn import simple_cnn
+import struct
 import sys
 
 
@@ -13,30 +14,28 @@ def main():
         armsim.parse(f.readlines())
 
     # Load the image into the memory of the assembly program
-    image_matrix = simple_cnn.load_image(image_file_name)
+    pixels = simple_cnn.load_image_bytes(image_file_name)
     image_address = armsim.sym_table['image']
-    for index in simple_cnn.iterate_matrix((simple_cnn.INPUT_IMAGE_SIZE, simple_cnn.INPUT_IMAGE_SIZE)):
-        y, x = index
-        pixel_address = image_address + y * simple_cnn.INPUT_IMAGE_SIZE + x
-        pixel = image_matrix[(y, x)]
-        armsim.mem[pixel_address:pixel_address + 1] = pixel.to_bytes(1, byteorder='little', signed=False)
+    armsim.mem[image_address:image_address + len(pixels)] = pixels
 
     armsim.run()
 
     # Print out the output of conv_max_pool
     print("Conv Max Pool Output:")
     output_address = armsim.sym_table['conv_max_pool_output']
-    for index in simple_cnn.iterate_matrix(
-            (simple_cnn.TOTAL_KERNELS, simple_cnn.MAX_POOL_OUTPUT_SIZE, simple_cnn.MAX_POOL_OUTPUT_SIZE,)):
-        k, j, i = index
-        address = output_address + (((k * simple_cnn.MAX_POOL_OUTPUT_SIZE * simple_cnn.MAX_POOL_OUTPUT_SIZE)
-                                     + (j * simple_cnn.MAX_POOL_OUTPUT_SIZE)
-                                     + i) * 4)
-        value = int.from_bytes(bytes(armsim.mem[address:address + 4]), byteorder='little', signed=True)
+    row_size = simple_cnn.MAX_POOL_OUTPUT_SIZE
+    kernel_size = row_size * row_size
+    output_length = simple_cnn.TOTAL_KERNELS * kernel_size * 4
+    # Decode the output region in place instead of slicing out a new
+    # 4 byte object for every value
+    output = memoryview(armsim.mem)[output_address:output_address + output_length]
+    # The (k, j, i) output is contiguous, so walk it with one flat index and
+    # only use it to detect the end of each row and kernel
+    for index, (value,) in enumerate(struct.iter_unpack('<i', output)):
         print(value, end=" ")
-        if i == simple_cnn.MAX_POOL_OUTPUT_SIZE - 1:
+        if (index + 1) % row_size == 0:
             print()
-            if j == simple_cnn.MAX_POOL_OUTPUT_SIZE - 1:
+            if (index + 1) % kernel_size == 0:
                 print()
 
 
@@ -53,12 +53,17 @@ def load_parameters(file_name, dimensions):
     return matrix
 
 
-def load_image(file_name):
+def open_image(file_name):
     image = Image.open(file_name)
     width, height = image.size
     if width != INPUT_IMAGE_SIZE or height != INPUT_IMAGE_SIZE:
         raise ValueError(f"Image size ({width}x{height}) does not match expected size ({INPUT_IMAGE_SIZE}x{INPUT_IMAGE_SIZE})")
+    return image
+
 
+def load_image(file_name):
+    image = open_image(file_name)
+    width, height = image.size
     matrix = create_matrix((INPUT_IMAGE_SIZE, INPUT_IMAGE_SIZE))
     for y in range(height):
         for x in range(width):
@@ -66,6 +71,17 @@ def load_image(file_name):
     return matrix
 
 
+def load_image_bytes(file_name):
+    # Returns the pixels as a flat row-major bytes object, which is the layout
+    # the assembly program uses for its image buffer
+    image = open_image(file_name)
+    if image.mode in ('L', 'P'):
+        return image.tobytes()
+    # Other modes (such as 1 bit images) are read pixel by pixel, the same
+    # way load_image reads them
+    return bytes(int(value) for value in image.getdata())
+
+
 def relu(x):
     return max(0, x)
 
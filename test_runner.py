@@ -1,4 +1,8 @@
 import armsim
+import armdb
+import contextlib
+import io
+import sys
 #run instruction tests
 
 '''
@@ -38,6 +42,216 @@ assert armsim.reg['x9'] == -88
 assert armsim.reg['x10'] == 65448
 armsim.reset()
 
+''' x29 is another name for the frame pointer '''
+armsim.parse(['main:', 'mov x29, 5', 'mov x0, x29'])
+armsim.run()
+assert armsim.reg['x0'] == 5 and armsim.reg['fp'] == 5, "x29 should be an alias for fp"
+armsim.reset()
+
+''' Branch targets follow edits made to the program after parse() '''
+armsim.parse(['main:', 'mov x0, 0', 'loop:', 'add x0, x0, 1', 'cmp x0, 6', 'b.lt loop'])
+armsim.asm[0:0] = ['mov x1, 1', 'mov x2, 2']
+armsim.run()
+assert armsim.reg['x0'] == 6, "edited program returned incorrect value of {}".format(armsim.reg['x0'])
+armsim.reset()
+
+''' Duplicate labels are found in the program as it is when it runs '''
+armsim.parse(['main:', 'mov x0, 7'])
+armsim.asm += ['b done', 'done:']
+armsim.run()
+assert armsim.reg['x0'] == 7, "a new label should not count as a duplicate"
+armsim.reset()
+armsim.parse(['main:', 'mov x0, 7', 'done:'])
+armsim.asm += ['done:']
+try:
+	armsim.run()
+	assert False, "duplicate label was not detected"
+except ValueError as e:
+	assert "more than once" in str(e), e
+armsim.reset()
+
+''' The loop and label checks use the labels of the program as it is when it runs '''
+armsim.parse(['main:', 'mov x0, 1'])
+armsim.asm[:] = ['start:', 'mov x0, 1', 'b start']
+armsim.forbid_loops = True
+try:
+	armsim.run()
+	assert False, "loop added after parse() was not detected"
+except ValueError as e:
+	assert "loop" in str(e), e
+armsim.reset()
+armsim.parse(['main:', 'b end', 'end:'])
+armsim.asm.remove('end:')
+try:
+	armsim.run()
+	assert False, "label removed after parse() was not detected"
+except ValueError as e:
+	assert "nonexistent label" in str(e), e
+armsim.reset()
+
+'''
+Compiled blocks: the loops run past BLOCK_THRESHOLD, so their blocks are
+compiled, and the fill loop raises from inside its block once it runs
+out of memory. Everything it leaves behind must match a run where no
+block is compiled
+'''
+tier_program = ['.bss', 'arr: .space 800', '.text', 'main:',
+	'ldur x1, =arr', 'mov x2, 0', 'mov x6, 0',
+	'sum:', 'add x2, x2, 1', 'and x4, x2, 7', 'lsl x4, x4, 3', 'add x4, x1, x4',
+	'stur x2, [x4, 0]', 'ldur x5, [x4, 0]', 'add x6, x6, x5', 'cmp x2, 200', 'b.lt sum',
+	'mov x7, 0',
+	'fill:', 'add x7, x7, 1', 'stur x7, [x1, 0]', 'add x1, x1, 8', 'b fill']
+def tier_run(threshold):
+	armsim.parse(tier_program)
+	armsim.BLOCK_THRESHOLD = threshold
+	try:
+		armsim.run()
+		assert False, "fill loop should run out of memory"
+	except ValueError as e:
+		assert "out of bounds" in str(e), e
+	state = (list(armsim.reg_vals), bytes(armsim.mem), armsim.cycle_count, armsim.execute_count,
+		dict(armsim.label_hit_counts), armsim.pc, armsim.z_flag, armsim.n_flag)
+	blocks = len(armsim.compiled_blocks)
+	armsim.BLOCK_THRESHOLD = 50
+	armsim.reset()
+	return state, blocks
+tiered, blocks = tier_run(50)
+untiered, no_blocks = tier_run(float('inf'))
+assert blocks > 0 and no_blocks == 0, "blocks were not compiled as expected"
+assert tiered == untiered, "compiled blocks changed the result of the program"
+
+'''
+Generated code: the function compiled for an instruction must leave the
+simulator in the same state as running its handler. There is one sample
+line for every opcode
+'''
+generated_samples = ['ldursw x0, [x1]', 'ldursw x0, [x1, 8]', 'ldursw x0, [x1, x2]',
+	'ldurh x0, [x1]', 'ldursh x0, [x1, 8]', 'ldurh x0, [x1, x2]',
+	'ldurb x0, [x1]', 'ldursb x0, [x1, 8]', 'ldurb x0, [x1, x2]',
+	'ldur x0, =values', 'ldur x0, [x1]', 'ldur x0, [x1, 8]', 'ldur x0, [x1, x2]',
+	'sturw x3, [x1]', 'sturw x3, [x1, 4]', 'sturw x3, [x1, x2]',
+	'sturh x3, [x1]', 'sturh x3, [x1, 4]', 'sturh x3, [x1, x2]',
+	'sturb x3, [x1]', 'sturb x3, [x1, 4]', 'sturb x3, [x1, x2]',
+	'stur x3, [x1]', 'stur x3, [x1, 8]', 'stur x3, [x1, x2]',
+	'mov x0, 7', 'mov x0, x3', 'asr x0, x3, 2', 'asr x0, x3, x2', 'lsr x0, x3, 2', 'lsr x0, x3, x2',
+	'lsl x0, x3, 2', 'lsl x0, x3, x2', 'adds x0, x3, 5', 'add x0, x3, x4', 'subs x0, x3, 5', 'sub x0, x3, x4',
+	'mul x0, x3, x4', 'udiv x0, x3, x4', 'sdiv x0, x3, x4', 'cmp x3, x4', 'cmp x3, 5',
+	'ands x0, x3, 6', 'and x0, x3, x4', 'orr x0, x3, 6', 'orr x0, x3, x4', 'eor x0, x3, 6', 'eor x0, x3, x4',
+	'cbnz x3, target', 'cbz x3, target', 'b target', 'b.lt target', 'b.le target', 'b.gt target',
+	'b.ge target', 'b.eq target', 'b.ne target', 'b.mi target', 'b.pl target', 'bl target', 'br lr', 'svc 0']
+armsim.parse(['.data', 'values: .dword 5, -6, 7, 8', '.text', 'main:', 'target:'] + generated_samples)
+def generated_state(run_insn):
+	armsim.restart()
+	armsim.reg_vals[:5] = [armsim.original_break + 16, armsim.sym_table['values'], 1, -9, 3]
+	armsim.reg_vals[8] = 214
+	armsim.reg_vals[armsim.REG_LR] = 3
+	armsim.pc, armsim.cycle_count = 3, 10
+	armsim.ld_dst, armsim.ld_cycle, armsim.flag_cycle = 1, 9, 9
+	armsim.n_flag = True
+	armsim.label_hit_counts = {'target:': 0}
+	armsim.recursed_labels.clear()
+	try:
+		run_insn()
+		error = None
+	except Exception as e:
+		error = repr(e)
+	return (error, list(armsim.reg_vals), bytes(armsim.mem), armsim.pc, armsim.brk, armsim.cycle_count, armsim.execute_count,
+		armsim.current_cycle, armsim.last_dst, armsim.ld_dst, armsim.ld_cycle, armsim.flag_cycle,
+		armsim.z_flag, armsim.n_flag, dict(armsim.label_hit_counts), set(armsim.recursed_labels))
+sampled_ops = set()
+for line in generated_samples:
+	insn = armsim.decode(line)
+	sampled_ops.add(insn.op)
+	expected = generated_state(lambda: armsim.execute_insn(insn))
+	actual = generated_state(armsim.compile_insn(insn))
+	assert actual == expected, "generated code for {} does not match its handler".format(line)
+assert sampled_ops == set(range(armsim.OP_LDURSW_RN, armsim.OP_SVC + 1)), "every opcode needs a sample"
+armsim.reset()
+
+'''
+restart(): running a program again after restart() gives the same
+result as the first run, and aliases to mem and reg stay valid. The
+program is then debugged with armdb, with an init callback that sets
+up the input the same way
+'''
+with open('examples/sort.s', 'r') as f:
+	armsim.parse(f.readlines())
+mem_alias, reg_alias, reg_vals_alias = armsim.mem, armsim.reg, armsim.reg_vals
+def restart_state():
+	return (list(armsim.reg_vals), bytes(armsim.mem), armsim.cycle_count, armsim.execute_count,
+		armsim.z_flag, armsim.n_flag, dict(armsim.label_hit_counts))
+armsim.run()
+first_run = restart_state()
+armsim.restart()
+# sort.s sorts numbers in place, so the aliases must show the unsorted input again
+assert mem_alias[armsim.sym_table['numbers']] == 9 and reg_alias['x8'] == 0, "restart() did not reset the aliases"
+armsim.run()
+assert restart_state() == first_run, "restart() did not reset the simulator"
+assert armsim.mem is mem_alias and armsim.reg_vals is reg_vals_alias and armsim.reg is reg_alias, \
+	"restart() replaced mem or reg"
+def restart_init():
+	armsim.mem[armsim.sym_table['numbers']] = 1
+armsim.restart()
+restart_init()
+armsim.run()
+init_run = restart_state()
+assert init_run[1] != first_run[1], "init did not change the input"
+armsim.restart()
+sys.stdin = io.StringIO('c\n')
+with contextlib.redirect_stdout(io.StringIO()):
+	armdb.debug(restart_init)
+sys.stdin = sys.__stdin__
+assert restart_state()[:4] == init_run[:4], "armdb.debug(init) did not run the program like run()"
+armsim.reset()
+
+'''
+count_label_hits: label_hit_counts is only filled in when the flag is
+set. The loop falls into check: more than BLOCK_THRESHOLD times, so the
+block that starts at it is compiled, and a block compiled for one
+setting of the flag must not be reused for the other
+'''
+armsim.parse(['main:', 'mov x0, 0', 'loop:', 'bl inc', 'check:', 'cmp x0, 100', 'b.lt loop', 'b done',
+	'inc:', 'add x0, x0, 1', 'br lr', 'done:'])
+expected_counts = {'loop:': 1, 'check:': 100, 'inc:': 100, 'done:': 0}
+armsim.run()
+assert armsim.label_hit_counts == expected_counts, "incorrect label hit counts {}".format(armsim.label_hit_counts)
+armsim.restart()
+armsim.count_label_hits = False
+armsim.run()
+assert armsim.reg['x0'] == 100 and armsim.label_hit_counts == {}, "labels were counted with count_label_hits off"
+armsim.restart()
+armsim.count_label_hits = True
+armsim.run()
+assert armsim.label_hit_counts == expected_counts, "incorrect label hit counts {}".format(armsim.label_hit_counts)
+armsim.reset()
+
+''' stur stores a negative value as two's complement '''
+armsim.parse(['.data', 'value: .dword 0', '.text', 'main:',
+	'mov x1, -5', 'ldur x2, =value', 'stur x1, [x2, 0]', 'ldursw x3, [x2, 0]', 'ldur x4, [x2, 0]'])
+armsim.run()
+assert armsim.reg['x3'] == -5 and armsim.reg['x4'] == 2**64 - 5, "stur stored a negative value incorrectly"
+armsim.reset()
+
+''' ldursw and sturw can't access any of the 4 bytes past the end of memory '''
+for line in ['ldursw x1, [x2, 5]', 'ldursw x1, [x2, x3]', 'sturw x1, [x2, 6]', 'sturw x1, [x2, x3]']:
+	armsim.parse(['.data', 'value: .dword 0', '.text', 'main:', 'ldur x2, =value', 'mov x3, 6', line])
+	mem_size = len(armsim.mem)
+	try:
+		armsim.run()
+		assert False, "{} accessed memory past the end".format(line)
+	except ValueError as e:
+		assert "out of bounds" in str(e), e
+	assert len(armsim.mem) == mem_size, "{} changed the size of memory".format(line)
+	armsim.reset()
+
+''' sturw, sturh and sturb store the low bytes of a value too big for a signed dword '''
+armsim.parse(['.data', 'value: .dword -1', 'low: .dword 0', '.text', 'main:',
+	'ldur x2, =value', 'ldur x1, [x2, 0]', 'ldur x2, =low',
+	'sturw x1, [x2, 0]', 'sturh x1, [x2, 4]', 'sturb x1, [x2, 6]', 'ldur x3, [x2, 0]'])
+armsim.run()
+assert armsim.reg['x3'] == 0x00FFFFFFFFFFFFFF, "big values were stored incorrectly: {}".format(hex(armsim.reg['x3']))
+armsim.reset()
+
 print("All tests passed")  
 
 test = [5, 10, 15]